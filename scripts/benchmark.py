@@ -0,0 +1,263 @@
+__author__ = "Brandon Pickett"
+
+# ----------- IMPORTS ---------------------------- ||
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the data types of a real V3D export; each occurs once per trial, with X, Y, and Z columns
+DATA_TYPES = [ "FP1", "FP2", "FP3", "Left Knee Angle", "Right Knee Angle", "Left Knee Moment", "Right Knee Moment" ]
+FILLER_DATA_TYPES = [ "Left Hip Angle", "Right Hip Angle", "Left Ankle Angle", "Right Ankle Angle", "Left Hip Moment", "Right Hip Moment", "Pelvis Angle", "Trunk Angle" ]
+
+# every timed command is run by this small process (python -S -c), which prints the wall time and peak memory (ru_maxrss of
+# RUSAGE_CHILDREN) of the command to stderr and exits with its exit status; the kernel carries the peak RSS of the process
+# that execs into the ru_maxrss of the program it execs, so a command started straight from the benchmark would report at
+# least the benchmark's own footprint, and one started from here reports at least this helper's (see the rss floor)
+RUSAGE_HELPER = """
+import os, resource, sys, time
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+	try:
+		os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+		os.execvp(sys.argv[1], sys.argv[1:])
+	finally:
+		os._exit(127)
+pid, status = os.waitpid(pid, 0)
+seconds = time.perf_counter() - start
+print(seconds, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, file=sys.stderr)
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+# ---------- FUNCTIONS --------------------------- ||
+def handleArgs():
+
+	import argparse
+
+	parser = argparse.ArgumentParser(prog="benchmark.py", usage="%(prog)s [-o data/benchmark] [-r data/benchmark/results.jsonl] [--subjects 20] [--conditions 3] [--trials 6] [--frames 101] [--columns 500] [-a '--jobs 4'] [-GKhv]", description="Generate a synthetic V3D cohort and time the reformat.py pipeline, writeConcatenatedOutput (reformat.py --concatenate-only), reorient.awk, and reorient.py on it. Wall time and peak memory (max RSS) of every step are appended, as one JSON object per run, to the results file so regressions can be tracked as the cohort grows.", add_help=False)
+
+	cohort_group = parser.add_argument_group("Synthetic Cohort")
+	cohort_group.add_argument("--subjects", dest="num_subjects", metavar="int", type=int, action="store", help="The number of subjects (samples). [default: 20]", default=20, required=False)
+	cohort_group.add_argument("--conditions", dest="num_conditions", metavar="int", type=int, action="store", help="The number of conditions, including the control. [default: 3]", default=3, required=False)
+	cohort_group.add_argument("--trials", dest="num_trials", metavar="int", type=int, action="store", help="The number of trials (stances) in every file. [default: 6]", default=6, required=False)
+	cohort_group.add_argument("--frames", dest="num_frames", metavar="int", type=int, action="store", help="The number of frames (data rows) in every file. [default: 101]", default=101, required=False)
+	cohort_group.add_argument("--columns", dest="num_columns", metavar="int", type=int, action="store", help="The total number of columns in every file, including the frame column. Columns beyond those needed for the trials are filled with other data types. [default: 500]", default=500, required=False)
+	cohort_group.add_argument("--missing", dest="missing", metavar="float", type=float, action="store", help="The fraction of data cells left empty. [default: 0.001]", default=0.001, required=False)
+	cohort_group.add_argument("--seed", dest="seed", metavar="int", type=int, action="store", help="The seed of the random number generator. [default: 1]", default=1, required=False)
+
+	output_group = parser.add_argument_group("Output Files")
+	output_group.add_argument("-o", "--output-dir", dest="output_dir", metavar="data/benchmark", type=str, action="store", help="The directory the cohort (demographics.csv, samples.list, conditions.list, and input/) and the outputs of the benchmarked steps are written to. [default: data/benchmark]", default="data/benchmark", required=False)
+	output_group.add_argument("-r", "--results", dest="results_fn", metavar="results.jsonl", type=str, action="store", help="The file the results are appended to, one JSON object per run. [default: ${output_dir}/results.jsonl]", default=None, required=False)
+
+	options_group = parser.add_argument_group("Options")
+	options_group.add_argument("-a", "--reformat-args", dest="reformat_args", metavar="'--jobs 4'", type=str, action="store", help="Extra arguments (quoted) for the timed reformat.py run, e.g., to compare --jobs, --stream, or --cache-dir. A single option must be attached with '=', e.g., --reformat-args=--stream. [default: none]", default="", required=False)
+	options_group.add_argument("-G", "--generate-only", dest="generate_only", action="store_true", help="Only generate the synthetic cohort; do not run the benchmarks.", required=False)
+	options_group.add_argument("-K", "--keep-cohort", dest="keep_cohort", action="store_true", help="Reuse a cohort already in the output directory instead of generating it again. The cohort parameters recorded with the results are then those given on the command line, so they should match.", required=False)
+
+	misc_group = parser.add_argument_group("Misc", )
+	misc_group.add_argument("-h", "--help", action="help", help="Show this help message and exit")
+	misc_group.add_argument("-v", "--version", action="version", version="%(prog)s 0.2.1-beta", help="Show version number and exit")
+
+	args = parser.parse_args()
+
+	# validate the arguments, as needed
+	for name,value,minimum in [ ("--subjects", args.num_subjects, 1), ("--conditions", args.num_conditions, 1), ("--trials", args.num_trials, 1), ("--frames", args.num_frames, 1) ]:
+		if value < minimum:
+			print(f"ERROR: {name} must be at least {minimum}. {value} is not a sane choice.", file=sys.stderr)
+			sys.exit(1)
+
+	min_columns = 1 + args.num_trials * len(DATA_TYPES) * 3
+	if args.num_columns < min_columns:
+		print(f"ERROR: {args.num_trials} trials need at least {min_columns} columns. {args.num_columns} is not enough.", file=sys.stderr)
+		sys.exit(1)
+
+	if not 0 <= args.missing < 1:
+		print(f"ERROR: --missing is a fraction of the cells. {args.missing} is not a sane choice.", file=sys.stderr)
+		sys.exit(1)
+
+	if args.results_fn is None:
+		args.results_fn = os.path.join(args.output_dir, "results.jsonl")
+
+	return args
+
+def generateColumns(num_trials, num_columns):
+	# (data type, direction) of every column after the frame column; each trial gets its block of
+	# measurement columns and the remaining columns are spread over the trials as filler
+	extra = num_columns - 1 - num_trials * len(DATA_TYPES) * 3
+
+	columns = []
+	for t in range(0,num_trials,1):
+		for data_type in DATA_TYPES:
+			for xyz in "XYZ":
+				columns.append( (data_type, xyz) )
+
+		num_filler = extra // num_trials + (1 if t < extra % num_trials else 0)
+		for f in range(0,num_filler,1):
+			columns.append( (FILLER_DATA_TYPES[(f // 3) % len(FILLER_DATA_TYPES)], "XYZ"[f % 3]) )
+
+	return columns
+
+def generateV3DFile(ofn, sample, condition, columns, num_frames, missing, rng):
+	# the 5 header lines of a V3D normalized export (data types on row 2, XYZ on row 5), then one row per frame
+	with open(ofn, 'w') as ofd:
+		ofd.write('\t'.join([''] + [f"{sample}_{condition}.c3d"] * len(columns)) + '\n')
+		ofd.write('\t'.join([''] + [ data_type for data_type,xyz in columns ]) + '\n')
+		ofd.write('\t'.join([''] + [ "FORCE" if data_type.startswith("FP") else "LINK_MODEL_BASED" for data_type,xyz in columns ]) + '\n')
+		ofd.write('\t'.join([''] + ["ORIGINAL"] * len(columns)) + '\n')
+		ofd.write('\t'.join(["ITEM"] + [ xyz for data_type,xyz in columns ]) + '\n')
+
+		for f in range(1,num_frames + 1,1):
+			cells = [ '' if rng.random() < missing else f"{rng.uniform(-1000, 1000):.6f}" for c in columns ]
+			ofd.write(str(f) + '\t' + '\t'.join(cells) + '\n')
+
+def generateCohort(output_dir, num_subjects, num_conditions, num_trials, num_frames, num_columns, missing=0.001, seed=1):
+	# writes demographics.csv, samples.list, conditions.list, and input/${condition}/${sample}_${condition}_normalized.txt
+	# (plus a samples.list per condition, for -P) into output_dir
+	import random
+
+	rng = random.Random(seed)
+	samples = [ f"S{i}" for i in range(1,num_subjects + 1,1) ]
+	conditions = ["control"] + [ f"cond{i}" for i in range(1,num_conditions,1) ]
+	columns = generateColumns(num_trials, num_columns)
+
+	os.makedirs(output_dir, exist_ok=True)
+
+	with open(os.path.join(output_dir, "demographics.csv"), 'w') as ofd:
+		ofd.write("subject,sex,age,height,mass,dom_limb,inv_limb,graft,speed_shod,speed_bare,control,underload,overload,symm\n")
+		for sample in samples:
+			ofd.write(f"{sample},{rng.choice('MF')},{rng.randint(18, 40)},{rng.uniform(150, 200):.1f},{rng.uniform(50, 110):.1f},{rng.randint(0, 1)},{rng.randint(0, 1)},BPTB,1.3,1.3,1,1,1,1\n")
+
+	with open(os.path.join(output_dir, "samples.list"), 'w') as ofd:
+		ofd.write('\n'.join(samples) + '\n')
+
+	with open(os.path.join(output_dir, "conditions.list"), 'w') as ofd:
+		ofd.write('\n'.join(conditions) + '\n')
+
+	for condition in conditions:
+		condition_dir = os.path.join(output_dir, "input", condition)
+		os.makedirs(condition_dir, exist_ok=True)
+
+		with open(os.path.join(condition_dir, "samples.list"), 'w') as ofd:
+			ofd.write('\n'.join(samples) + '\n')
+
+		for sample in samples:
+			generateV3DFile(os.path.join(condition_dir, f"{sample}_{condition}_normalized.txt"), sample, condition, columns, num_frames, missing, rng)
+
+	return samples, conditions
+
+def timeCommand(name, cmd, stdout_fn=None):
+	# runs cmd (through RUSAGE_HELPER) and returns its wall time and peak memory (max RSS of the process, in KiB)
+	import subprocess
+
+	ofd = open(stdout_fn, 'w') if stdout_fn is not None else subprocess.DEVNULL
+	try:
+		proc = subprocess.run([sys.executable, "-S", "-c", RUSAGE_HELPER] + cmd, stdout=ofd, stderr=subprocess.PIPE, text=True)
+	finally:
+		if stdout_fn is not None:
+			ofd.close()
+
+	if proc.returncode != 0:
+		print(f"ERROR: {name} failed (exit status {proc.returncode}): {' '.join(cmd)}", file=sys.stderr)
+		sys.exit(1)
+
+	seconds, max_rss = proc.stderr.split()
+	seconds = float(seconds)
+	max_rss_kib = int(max_rss) // 1024 if sys.platform == "darwin" else int(max_rss) # bytes on macOS, KiB elsewhere
+
+	return {"name": name, "seconds": round(seconds, 4), "max_rss_kib": max_rss_kib}
+
+def combineTimings(name, timings):
+	# one result for a step made of several commands (e.g., one per file)
+	return {"name": name, "seconds": round(sum(t["seconds"] for t in timings), 4), "max_rss_kib": max(t["max_rss_kib"] for t in timings), "commands": len(timings)}
+
+def runBenchmarks(output_dir, samples, conditions, reformat_args=""):
+	import shlex
+
+	python = sys.executable
+	reformat_py = os.path.join(SCRIPTS_DIR, "reformat.py")
+	out_dir = os.path.join(output_dir, "output") + '/'
+	os.makedirs(out_dir, exist_ok=True)
+
+	common = [ "-d", os.path.join(output_dir, "demographics.csv"), "-s", os.path.join(output_dir, "samples.list"), "-i", os.path.join(output_dir, "input"), "-c", os.path.join(output_dir, "conditions.list"), "-op", out_dir, "-D" ]
+	results = []
+
+	# the full reformat.py pipeline (per-condition and concatenated outputs)
+	results.append( timeCommand("reformat.py", [python, reformat_py] + common + shlex.split(reformat_args)) )
+	results[-1]["args"] = reformat_args
+
+	# the concatenation step alone, re-reading the per-condition outputs
+	results.append( timeCommand("writeConcatenatedOutput", [python, reformat_py] + common + ["--concatenate-only"]) )
+
+	# reorientation, one file at a time as reorientV3D2UNC.sh does it
+	ifns = [ os.path.join(output_dir, "input", condition, f"{sample}_{condition}_normalized.txt") for condition in conditions for sample in samples ]
+	reoriented_dir = os.path.join(output_dir, "reoriented")
+	os.makedirs(reoriented_dir, exist_ok=True)
+
+	timings = [ timeCommand("reorient.awk", ["awk", "-f", os.path.join(SCRIPTS_DIR, "reorient.awk"), "--", "X=>-Y", "Y=>X", ifn], stdout_fn=os.path.join(reoriented_dir, os.path.basename(ifn))) for ifn in ifns ]
+	results.append( combineTimings("reorient.awk", timings) )
+
+	# reorientation of every file by one reorient.py process; its outputs land next to the inputs, so they are removed
+	results.append( timeCommand("reorient.py", [python, os.path.join(SCRIPTS_DIR, "reorient.py"), "X=>-Y", "Y=>X"] + ifns) )
+	from reorient import reorientedFilename
+	for ifn in ifns:
+		os.remove(reorientedFilename(ifn))
+
+	return results
+
+def gitRevision():
+	import subprocess
+
+	try:
+		return subprocess.run(["git", "-C", SCRIPTS_DIR, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def inputBytes(output_dir):
+	total = 0
+	for root,dirs,files in os.walk(os.path.join(output_dir, "input")):
+		total += sum(os.path.getsize(os.path.join(root, fn)) for fn in files if fn.endswith("_normalized.txt"))
+
+	return total
+
+# ------------- MAIN ----------------------------- ||
+if __name__ == "__main__":
+
+	# handle the arguments to the script
+	args = handleArgs()
+
+	# generate (or reuse) the synthetic cohort
+	if args.keep_cohort:
+		from reformat import parseListFileAsList
+		samples = parseListFileAsList(os.path.join(args.output_dir, "samples.list"))
+		conditions = parseListFileAsList(os.path.join(args.output_dir, "conditions.list"))
+	else:
+		samples, conditions = generateCohort(args.output_dir, args.num_subjects, args.num_conditions, args.num_trials, args.num_frames, args.num_columns, missing=args.missing, seed=args.seed)
+
+	if args.generate_only:
+		sys.exit(0)
+
+	# run the benchmarks and append the results
+	import json
+	import platform
+	import time
+
+	record = {
+		"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+		"revision": gitRevision(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cohort": {"subjects": len(samples), "conditions": len(conditions), "trials": args.num_trials, "frames": args.num_frames, "columns": args.num_columns, "missing": args.missing, "seed": args.seed, "input_bytes": inputBytes(args.output_dir)},
+		"results": runBenchmarks(args.output_dir, samples, conditions, reformat_args=args.reformat_args),
+		"rss_floor_kib": timeCommand("true", ["true"])["max_rss_kib"], # the peak memory of any command is at least this
+	}
+
+	with open(args.results_fn, 'a') as ofd:
+		ofd.write(json.dumps(record) + '\n')
+
+	for result in record["results"]:
+		print(f"{result['name']}\t{result['seconds']:.3f} s\t{result['max_rss_kib'] / 1024:.1f} MiB", file=sys.stderr)
+	print(f"(peak memory is at least {record['rss_floor_kib'] / 1024:.1f} MiB, the footprint of the process that runs each command)", file=sys.stderr)
+
+	# exit
+	sys.exit(0)
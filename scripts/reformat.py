@@ -1,9 +1,579 @@
 __author__ = "Brandon Pickett"
 
 # ----------- IMPORTS ---------------------------- ||
+import os
 import sys
+import time
+from array import array
+from contextlib import contextmanager
+from operator import itemgetter
+
+NAN = float("nan")
+HEADER_LAYOUTS = {} # header layout fingerprint -> HeaderLayout, shared by every file read by this process
+COMPRESSION_EXTENSIONS = (".gz", ".bz2", ".xz") # files with these extensions are (de)compressed while they are read or written
+INPUT_SUFFIXES = tuple( "_normalized.txt" + ext for ext in ("",) + COMPRESSION_EXTENSIONS ) # uncompressed first, as preferred by Cohort.inputFile
+ESTIMATED_CELL_BYTES = 19 # a typical value as written by str(), plus its comma; only used to estimate output sizes
+MEASUREMENTS = [ "vgrf", "sagang", "frontang", "sagmom", "frontmom" ]
 
 # ----------- CLASSES ---------------------------- ||
+class ReformatError(Exception):
+	# a problem with the input data that stops the run; the command line reports it as an ERROR
+	pass
+
+class FrameBuffer:
+	# a frame x (sample x trial) matrix of doubles for one measurement of one condition,
+	# stored row-major so output rows can be sliced straight out of it; missing values are NaN
+
+	def __init__(self, num_frames, width):
+		self.num_frames = num_frames
+		self.width = width
+		self.data = array('d', [NAN]) * (num_frames * width)
+
+	def setColumn(self, c, values):
+		self.data[c::self.width] = values
+
+	def row(self, f):
+		return self.data[f * self.width:(f + 1) * self.width]
+
+class Configuration:
+	# one output variant: the options that only change which columns are selected and how they are
+	# scaled, plus where the output goes; several configurations can share one parse of the inputs
+
+	def __init__(self, outfnpre="data/output/", outfnsuf=".csv", num_trials=5, last_not_first=False, contralateral=False, downgrade=False, treadmill=True):
+		self.outfnpre = outfnpre
+		self.outfnsuf = outfnsuf
+		self.num_trials = num_trials
+		self.last_not_first = last_not_first
+		self.contralateral = contralateral
+		self.downgrade = downgrade
+		self.treadmill = treadmill
+
+	def options(self):
+		# the options that affect the parsed results (see ResultCache)
+		return {"num_trials": self.num_trials, "last_not_first": self.last_not_first, "contralateral": self.contralateral, "downgrade": self.downgrade, "treadmill": self.treadmill}
+
+class Cohort:
+	# the conditions of a study, the samples of each condition, and where their input files are and how they are
+	# reoriented (see loadCohort); the demographics are parsed once per limb choice, when first needed
+
+	def __init__(self, input_dir, conditions, condition_samples, demo_fn, control_condition="control", transformations=None, listings=None):
+		self.input_dir = input_dir
+		self.conditions = conditions
+		self.condition_samples = condition_samples
+		self.demo_fn = demo_fn
+		self.control_condition = control_condition
+		self.transformations = transformations
+		self.listings = listings if listings is not None else scanConditionDirs(input_dir, conditions)
+		self.demdicts = {}
+
+		self.reorientation = None
+		if transformations is not None:
+			from reorient import parseTransformations
+			self.reorientation = parseTransformations(transformations)
+
+	def demographics(self, contralateral=False):
+		if contralateral not in self.demdicts:
+			self.demdicts[contralateral] = parseDemographicsFile(self.demo_fn, contralateral=contralateral)
+
+		return self.demdicts[contralateral]
+
+	def inputFile(self, condition, sample):
+		# the path and size of the input file of a unit (uncompressed or compressed, as found by the directory
+		# scan), or None and 0 if there is none
+		name = f"{sample}_{condition}_normalized.txt"
+		listing = self.listings.get(condition) or {}
+		for ext in ("",) + COMPRESSION_EXTENSIONS:
+			if name + ext in listing:
+				return f"{self.input_dir}/{condition}/{name}{ext}", listing[name + ext]
+
+		return None, 0
+
+	def inputFilename(self, condition, sample):
+		# the uncompressed name is used for a missing file so that opening it reports the expected name
+		ifn, size = self.inputFile(condition, sample)
+		return ifn if ifn is not None else f"{self.input_dir}/{condition}/{sample}_{condition}_normalized.txt"
+
+	def missingInputs(self):
+		return [ (condition, sample) for condition in self.conditions for sample in self.condition_samples[condition] if self.inputFile(condition, sample)[0] is None ]
+
+	def validate(self, configs):
+		# raises ReformatError unless every unit has an input file and demographics (for the limb choice of every configuration)
+		missing = self.missingInputs()
+		if missing:
+			listed = ', '.join(f"{condition}/{sample}_{condition}_normalized.txt" for condition,sample in missing[:10])
+			if len(missing) > 10:
+				listed += f", ... ({len(missing) - 10} more)"
+			raise ReformatError(f"{len(missing)} input files are missing from {self.input_dir} (also looked for .gz, .bz2, and .xz): {listed}.")
+
+		for config in configs:
+			demographics = self.demographics(config.contralateral)
+			for condition in self.conditions:
+				for sample in self.condition_samples[condition]:
+					if sample not in demographics:
+						raise ReformatError(f"{sample} ({condition}) is not in {self.demo_fn}.")
+
+	def units(self, configs, measurements=MEASUREMENTS, cache_dir=None):
+		# every (condition, sample) unit, in order, to be parsed once for all configurations (see parseSample)
+		units = []
+		for condition in self.conditions:
+			for sample in self.condition_samples[condition]:
+				settings = [ (self.demographics(config.contralateral)[sample], config) for config in configs ]
+				units.append( (self.inputFilename(condition, sample), condition, sample, measurements, settings, cache_dir, self.reorientation) )
+
+		return units
+
+class Extraction:
+	# the output of one configuration in memory: buffers[condition][measurement] is a FrameBuffer with one row per
+	# frame and one column per (sample, trial), in the same order as the per-condition output files
+
+	def __init__(self, config, measurements, condition_samples):
+		self.config = config
+		self.measurements = measurements
+		self.condition_samples = condition_samples
+		self.buffers = {}
+
+	def values(self, condition, sample, trial, measurement):
+		# the values of every frame of a trial (0-based); missing values are NaN
+		if not 0 <= trial < self.config.num_trials:
+			raise IndexError(f"trial {trial} is out of range; there are {self.config.num_trials} trials (0 to {self.config.num_trials - 1}) per sample.")
+
+		buf = self.buffers[condition][measurement]
+		c = self.condition_samples[condition].index(sample) * self.config.num_trials + trial
+
+		return buf.data[c::buf.width]
+
+	def longRows(self):
+		# yields (condition, sample, trial, frame, measurement, value) for every value, with the trials
+		# and frames numbered from 1 (as the trials are in the output files); missing values are NaN
+		num_trials = self.config.num_trials
+
+		for condition,buffers in self.buffers.items():
+			for s,sample in enumerate(self.condition_samples[condition]):
+				for t in range(0,num_trials,1):
+					columns = [ buffers[measurement].data[s * num_trials + t::buffers[measurement].width] for measurement in self.measurements ]
+					for f,values in enumerate(zip(*columns), 1):
+						for measurement,value in zip(self.measurements, values):
+							yield condition, sample, t + 1, f, measurement, value
+
+	def writeLong(self, outfn):
+		# write the long-format table as CSV, with "NA" for missing values; returns the number of rows and bytes written
+		rows_written = 1
+
+		with openText(outfn, 'w') as ofd:
+			ofd.write("condition,sample,trial,frame,measurement,value\n")
+			for condition,sample,trial,frame,measurement,value in self.longRows():
+				ofd.write(f"{condition},{sample},{trial},{frame},{measurement},{stringify(value)}\n")
+				rows_written += 1
+
+		return rows_written, os.path.getsize(outfn)
+
+class CachedV3DFile:
+	# the header rows and the frame x column matrix of doubles of one V3D normalized file, memory-mapped
+	# from a binary cache entry; the entry is (re)built from the text file when it is missing or stale
+	#
+	# entry layout: magic, little-endian uint64 header length, JSON header, padding to 8 bytes, native doubles (row-major);
+	# cells that are not numbers (and cells missing from short rows) are only an error if their column is used, as when the
+	# text file is read directly, so the header records the first such error of every column
+
+	MAGIC = b"V3DCACHE"
+	FORMAT = 2
+	ERRORS = {"IndexError": IndexError, "ValueError": ValueError}
+
+	def __init__(self, ifn, cache_dir):
+		import hashlib
+
+		st = os.stat(ifn)
+		self.cachefn = os.path.join(cache_dir, hashlib.sha1(os.path.abspath(ifn).encode()).hexdigest() + ".v3d")
+		self.source = {"format": self.FORMAT, "source": os.path.abspath(ifn), "mtime_ns": st.st_mtime_ns, "size": st.st_size, "byteorder": sys.byteorder}
+		self.mm = None
+
+		if not self.open():
+			self.build(ifn)
+		else:
+			os.utime(self.cachefn) # the modification time marks the last use, for eviction
+
+	def open(self):
+		import json
+		import mmap
+		import struct
+
+		try:
+			with open(self.cachefn, 'rb') as ifd:
+				mm = mmap.mmap(ifd.fileno(), 0, access=mmap.ACCESS_READ)
+		except (FileNotFoundError, ValueError): # missing or empty
+			return False
+
+		# a damaged (e.g., truncated) entry is rebuilt like a stale one
+		start = len(self.MAGIC) + 8
+		try:
+			if mm[:len(self.MAGIC)] != self.MAGIC:
+				raise ValueError("not a cache entry")
+			(header_len,) = struct.unpack("<Q", mm[len(self.MAGIC):start])
+			header = json.loads(mm[start:start + header_len])
+			if any(header.get(k) != v for k,v in self.source.items()):
+				raise ValueError("stale")
+			offset = (start + header_len + 7) // 8 * 8
+			if len(mm) < offset + 8 * header["num_frames"] * header["num_columns"]:
+				raise ValueError("truncated")
+			invalid = { j: (kind, message) for j,kind,message in header["invalid"] }
+		except (ValueError, struct.error, AttributeError, KeyError, TypeError):
+			mm.close()
+			return False
+
+		self.mm = mm
+		self.data_types = header["data_types"]
+		self.xyzs = header["xyzs"]
+		self.num_frames = header["num_frames"]
+		self.num_columns = header["num_columns"]
+		self.invalid = invalid
+		self.values = memoryview(mm)[offset:offset + 8 * self.num_frames * self.num_columns].cast('d')
+
+		return True
+
+	def build(self, ifn):
+		import json
+		import struct
+
+		with openText(ifn) as ifd:
+			self.data_types, self.xyzs = readHeader(ifd)
+			self.num_columns = len(self.data_types)
+			padding = array('d', [NAN]) * self.num_columns
+
+			self.values = array('d')
+			self.num_frames = 0
+			self.invalid = {} # column -> (exception name, message) of its first unusable cell
+			for line in ifd:
+				fields = line.rstrip('\n').split('\t')[:self.num_columns]
+				try:
+					self.values.extend([ float(x) if x else NAN for x in fields ])
+				except ValueError: # only rows with a cell that is not a number take the slow path
+					for j,x in enumerate(fields):
+						try:
+							self.values.append(float(x) if x else NAN)
+						except ValueError as e:
+							self.values.append(NAN)
+							self.invalid.setdefault(j, ("ValueError", str(e)))
+				if len(fields) < self.num_columns: # short rows are padded with missing data
+					for j in range(len(fields), self.num_columns):
+						self.invalid.setdefault(j, ("IndexError", "list index out of range"))
+					self.values.extend(padding[len(fields):])
+				self.num_frames += 1
+
+		header = dict(self.source, data_types=self.data_types, xyzs=self.xyzs, num_frames=self.num_frames, num_columns=self.num_columns, invalid=[ [j, kind, message] for j,(kind, message) in sorted(self.invalid.items()) ])
+		header = json.dumps(header).encode()
+		start = len(self.MAGIC) + 8
+
+		# write to a private file first so concurrent workers never see a partial entry
+		tmpfn = f"{self.cachefn}.{os.getpid()}.tmp"
+		with open(tmpfn, 'wb') as ofd:
+			ofd.write(self.MAGIC + struct.pack("<Q", len(header)) + header)
+			ofd.write(b"\0" * ((start + len(header) + 7) // 8 * 8 - start - len(header)))
+			self.values.tofile(ofd)
+		os.replace(tmpfn, self.cachefn)
+
+	def column(self, j):
+		return array('d', self.values[j::self.num_columns])
+
+	def columns(self, selected):
+		# {j: column} for the selected columns, failing like reading them from the text file does: a short row
+		# first, then the first cell that is not a number
+		for kind in ("IndexError", "ValueError"):
+			for j in selected:
+				if j in self.invalid and self.invalid[j][0] == kind:
+					raise self.ERRORS[kind](self.invalid[j][1])
+
+		return { j: self.column(j) for j in selected }
+
+	def close(self):
+		if self.mm is not None:
+			self.values.release()
+			self.mm.close()
+			self.mm = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+class HeaderLayout:
+	# the column positions of every (data type, direction) pair of a header, indexed in a single pass;
+	# the resolved columns and inversion decision of each measurement are remembered
+
+	def __init__(self, fingerprint, data_types, xyzs):
+		self.id = fingerprint
+		self.num_columns = len(data_types)
+		self.columns = {}
+		for i,data_type,xyz in zip(range(0,len(data_types),1),data_types,xyzs):
+			self.columns.setdefault( (data_type, xyz), [] ).append(i)
+		self.resolved = {}
+
+	def resolve(self, measurement, inv_limb, downgrade=False, treadmill=True):
+		key = (measurement, inv_limb, downgrade, treadmill)
+		if key not in self.resolved:
+			field, direction, invert = measurementColumn(measurement, inv_limb, downgrade=downgrade, treadmill=treadmill)
+			self.resolved[key] = ( self.columns.get( (field, direction), [] ), invert )
+
+		indices, invert = self.resolved[key]
+		return list(indices), invert
+
+class ResultCache:
+	# per-sample results of a previous run, kept next to the output files so that a rerun only
+	# reparses the (condition, sample) units whose input file, demographics, or options changed;
+	# it is named after both the prefix and the suffix, as every configuration (variant) needs its own; result files are named
+	# after what they were computed from, so a run that fails before saving the manifest never changes what it points to
+
+	def __init__(self, outfnpre, outfnsuf, options):
+		import json
+		from pathlib import Path
+
+		self.dir = Path(f"{outfnpre}{outfnsuf}.incremental")
+		self.manifest_fn = self.dir / "manifest.json"
+		self.options = options
+		self.units = {} # the units of the previous run that are still usable
+		self.fingerprints = {} # the units of this run
+
+		if self.manifest_fn.is_file():
+			with open(self.manifest_fn, 'r') as ifd:
+				manifest = json.load(ifd)
+			if manifest.get("options") == options:
+				self.units = manifest["units"]
+
+	def key(self, condition, sample):
+		return f"{condition}/{sample}"
+
+	def resultName(self, key, fingerprint):
+		import hashlib
+		import json
+
+		digest = hashlib.sha256(json.dumps([self.options, fingerprint["demographics"], fingerprint["sha256"]], sort_keys=True).encode()).hexdigest()
+		return f"{key}.{digest[:16]}.bin"
+
+	def resultFilename(self, name):
+		return self.dir / name
+
+	def has(self, ifn, condition, sample, dem):
+		key = self.key(condition, sample)
+
+		if key not in self.fingerprints:
+			fingerprint = {"input": ifn, "size": os.path.getsize(ifn), "demographics": dem, "sha256": None}
+			previous = self.units.get(key)
+			if previous is not None and all(previous.get(k) == fingerprint[k] for k in ("input", "size", "demographics")): # only hash when it could match
+				fingerprint["sha256"] = hashFile(ifn)
+			fingerprint["reuse"] = fingerprint["sha256"] is not None and previous.get("sha256") == fingerprint["sha256"] and previous.get("result") is not None and self.resultFilename(previous["result"]).is_file()
+			self.fingerprints[key] = fingerprint
+
+		return self.fingerprints[key]["reuse"]
+
+	def load(self, condition, sample, measurements, num_trials):
+		# returns None if the result file does not hold as many values as the manifest says, so the unit is reparsed
+		key = self.key(condition, sample)
+		previous = self.units[key]
+		num_frames = previous["num_frames"]
+		num_values = len(measurements) * num_trials * num_frames
+
+		fn = self.resultFilename(previous["result"])
+		if fn.stat().st_size != num_values * array('d').itemsize:
+			return None
+
+		values = array('d')
+		with open(fn, 'rb') as ifd:
+			values.fromfile(ifd, num_values)
+		self.fingerprints[key].update(num_frames=num_frames, result=previous["result"])
+
+		output = {}
+		for m,measurement in enumerate(measurements):
+			output[measurement] = [ values[(m * num_trials + t) * num_frames:(m * num_trials + t + 1) * num_frames] for t in range(0,num_trials,1) ]
+
+		layout = previous.get("layout")
+		self.fingerprints[key]["layout"] = layout
+
+		return output, layout
+
+	def store(self, condition, sample, measurements, result):
+		output, layout = result
+		key = self.key(condition, sample)
+		fingerprint = self.fingerprints[key]
+		if fingerprint["sha256"] is None:
+			fingerprint["sha256"] = hashFile(fingerprint["input"])
+		fingerprint["num_frames"] = len(output[measurements[0]][0])
+		fingerprint["layout"] = layout
+		fingerprint["result"] = self.resultName(key, fingerprint)
+
+		# a new name (or the same content) never changes a result file the manifest on disk points to
+		fn = self.resultFilename(fingerprint["result"])
+		fn.parent.mkdir(parents=True, exist_ok=True)
+		tmpfn = fn.with_name(fn.name + ".tmp")
+		with open(tmpfn, 'wb') as ofd:
+			for measurement in measurements:
+				for values in output[measurement]:
+					values.tofile(ofd)
+		os.replace(tmpfn, fn)
+
+	def save(self):
+		import json
+
+		self.dir.mkdir(parents=True, exist_ok=True)
+		tmpfn = self.dir / "manifest.json.tmp"
+		with open(tmpfn, 'w') as ofd:
+			units = {}
+			for key,fingerprint in self.fingerprints.items():
+				units[key] = { k: v for k,v in fingerprint.items() if k != "reuse" }
+			json.dump({"options": self.options, "units": units}, ofd, indent=1)
+		os.replace(tmpfn, self.manifest_fn)
+
+		# forget the results that the manifest no longer points to: older results, those of units that are no longer
+		# part of the run, and those left by runs that failed
+		kept = { fingerprint.get("result") for fingerprint in self.fingerprints.values() }
+		for fn in list(self.dir.glob("*/*.bin")) + list(self.dir.glob("*/*.tmp")):
+			if fn.relative_to(self.dir).as_posix() not in kept:
+				fn.unlink(missing_ok=True)
+
+class Stats:
+	# wall time per stage, counters (rows, bytes, cells, files), and the timings of every (condition, sample)
+	# unit of one run; each unit is parsed with its own Stats, possibly in a worker process, and added afterwards
+
+	def __init__(self):
+		self.stages = {} # stage -> seconds spent in this process, in the order the stages were first entered
+		self.unit_stages = {} # stage -> seconds summed over all parsed units (which may overlap in time with --jobs)
+		self.counts = {}
+		self.units = []
+
+	def add(self, stage, seconds):
+		self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+	@contextmanager
+	def stage(self, stage):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add(stage, time.perf_counter() - start)
+
+	def count(self, counter, n):
+		self.counts[counter] = self.counts.get(counter, 0) + n
+
+	def addUnit(self, condition, sample, source, seconds, unit_stats):
+		self.units.append({"condition": condition, "sample": sample, "source": source, "seconds": seconds, "stages": unit_stats.stages, "counts": unit_stats.counts})
+		for stage,unit_seconds in unit_stats.stages.items():
+			self.unit_stages[stage] = self.unit_stages.get(stage, 0.0) + unit_seconds
+		for counter,n in unit_stats.counts.items():
+			self.count(counter, n)
+
+	def peakRSS(self):
+		# the peak resident set size (KiB) of this process and of its largest (already finished) child process, e.g., a --jobs worker
+		try:
+			import resource
+		except ImportError: # not available on this platform
+			return None
+
+		scale = 1024 if sys.platform == "darwin" else 1 # ru_maxrss is in bytes on macOS and in KiB elsewhere
+		return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale, "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale}
+
+	def report(self, wall):
+		# cells are converted to doubles in the "read" stage of each unit, or all at once when streaming
+		read_seconds = self.unit_stages.get("read", 0.0) + self.stages.get("stream", 0.0)
+		cells_per_second = self.counts.get("cells read", 0) / read_seconds if read_seconds > 0 else None
+
+		return {"wall_seconds": wall, "stages": self.stages, "unit_stages": self.unit_stages, "counts": self.counts, "cells_per_second": cells_per_second, "peak_rss_kib": self.peakRSS(), "units": self.units}
+
+	def summaryLines(self, wall):
+		report = self.report(wall)
+
+		yield f"STATS: {wall:.3f} s wall time"
+		for stage,seconds in report["stages"].items():
+			yield f"STATS: {seconds:10.3f} s  {stage}"
+		for stage,seconds in report["unit_stages"].items():
+			yield f"STATS: {seconds:10.3f} s  {stage} (summed over {len(self.units)} units)"
+		for counter,n in report["counts"].items():
+			yield f"STATS: {n:10d}    {counter}"
+		if report["cells_per_second"] is not None:
+			yield f"STATS: {report['cells_per_second']:10.0f}    cells read per second"
+		if report["peak_rss_kib"] is not None:
+			yield f"STATS: {report['peak_rss_kib']['self'] / 1024:10.1f} MiB peak RSS (largest child process: {report['peak_rss_kib']['children'] / 1024:.1f} MiB)"
+
+		if self.units:
+			slowest = max(self.units, key=lambda unit: unit["seconds"])
+			yield f"STATS: {slowest['seconds']:10.3f} s  slowest unit ({slowest['condition']} {slowest['sample']}, {slowest['source']})"
+
+class Diagnostics:
+	# missing cells and short trials per (condition, sample, measurement), with the missing cells of each input column
+	# kept as ranges of csv rows, plus the fraction of "NA" output cells per (condition, sample); like Stats, each unit
+	# is parsed with its own Diagnostics, possibly in a worker process, and merged afterwards
+
+	def __init__(self):
+		self.missing = {} # (condition, sample, measurement) -> {input column index: [[first row, last row], ...]}
+		self.short = {} # (condition, sample, measurement) -> [trials present, trials expected]
+		self.cells = {} # (condition, sample) -> [NA output cells, output cells]
+
+	def addMissing(self, condition, sample, measurement, j, rows):
+		# rows are the 0-based frames of column j that are missing
+		columns = self.missing.setdefault((condition, sample, measurement), {})
+		if j in columns: # already seen through another configuration
+			return
+
+		ranges = []
+		for row in rows:
+			row_num = row + 6 # the main data starts at row #6 because of 5 header lines
+			if ranges and ranges[-1][1] == row_num - 1:
+				ranges[-1][1] = row_num
+			else:
+				ranges.append([row_num, row_num])
+		columns[j] = ranges
+
+	def addShortTrials(self, condition, sample, measurement, present, expected):
+		key = (condition, sample, measurement)
+		if key not in self.short or self.short[key][1] < expected:
+			self.short[key] = [present, expected]
+
+	def addCells(self, condition, sample, na, total):
+		cells = self.cells.setdefault((condition, sample), [0, 0])
+		cells[0] += na
+		cells[1] += total
+
+	def merge(self, other):
+		for key,columns in other.missing.items():
+			for j,ranges in columns.items():
+				self.missing.setdefault(key, {}).setdefault(j, ranges)
+		for key,(present, expected) in other.short.items():
+			self.addShortTrials(*key, present, expected)
+		for (condition, sample),(na, total) in other.cells.items():
+			self.addCells(condition, sample, na, total)
+
+	def missingFraction(self, condition, sample):
+		na, total = self.cells.get((condition, sample), (0, 0))
+		return na / total if total > 0 else 0.0
+
+	def summaryLines(self, max_ranges=5):
+		for (condition, sample, measurement),(present, expected) in self.short.items():
+			yield f"WARNING: Insufficient trials for {condition} {sample} {measurement}. {present} present, {expected} expected. Missing trials added and filled with NAs."
+
+		for (condition, sample, measurement),columns in self.missing.items():
+			num_cells = sum(last - first + 1 for ranges in columns.values() for first,last in ranges)
+			described = []
+			for j,ranges in sorted(columns.items()):
+				rows = ','.join(f"{first}-{last}" if last > first else f"{first}" for first,last in ranges[:max_ranges])
+				if len(ranges) > max_ranges:
+					rows += f",... ({len(ranges) - max_ranges} more ranges)"
+				described.append(f"column {j+1} rows {rows}")
+			yield f"WARNING: missing data in {condition} {sample} {measurement}: {num_cells} cells are filled with an \"NA\" in the output (csv {'; '.join(described)})."
+
+		na = sum(na for na,total in self.cells.values())
+		total = sum(total for na,total in self.cells.values())
+		if na > 0:
+			worst = max(self.cells, key=lambda key: self.missingFraction(*key))
+			yield f"NOTE: {na} of {total} output cells ({na / total:.2%}) are \"NA\"; the most ({self.missingFraction(*worst):.2%}) are in {worst[0]} {worst[1]}."
+
+	def report(self):
+		missing = []
+		for (condition, sample, measurement),columns in self.missing.items():
+			for j,ranges in sorted(columns.items()):
+				missing.append({"condition": condition, "sample": sample, "measurement": measurement, "column": j + 1, "cells": sum(last - first + 1 for first,last in ranges), "rows": ranges})
+
+		short = [ {"condition": condition, "sample": sample, "measurement": measurement, "present": present, "expected": expected} for (condition, sample, measurement),(present, expected) in self.short.items() ]
+		cells = [ {"condition": condition, "sample": sample, "na": na, "total": total, "fraction": self.missingFraction(condition, sample)} for (condition, sample),(na, total) in self.cells.items() ]
+
+		return {"missing": missing, "short_trials": short, "cells": cells}
 
 # ---------- FUNCTIONS --------------------------- ||
 def handleArgs():
@@ -13,30 +583,47 @@ def handleArgs():
 
 	import argparse
 
-	parser = argparse.ArgumentParser(prog="reformat.py", usage="%(prog)s [-d demo.csv] [-s sample.list] [-i data/input] [-op data/output/] [-os .csv] [-c data/conditions.list] [-C control] [-n 5] [-DglLNPThv]", description="Prepare Visual 3D (V3D) data for FNOVA at UNC-CH", add_help=False)
+	parser = argparse.ArgumentParser(prog="reformat.py", usage="%(prog)s [-d demo.csv] [-s sample.list] [-i data/input] [-op data/output/] [-os .csv] [-c data/conditions.list] [-C control] [-n 5] [-j 1] [-R 'X=>-Y' ...] [-V '-op out/ -l' ...] [-z gz] [-W] [--max-missing 1] [--diagnostics diagnostics.json] [--stats] [--stats-file stats.json] [--profile reformat.prof] [--dry-run] [-ADgIlLNPSThv]", description="Prepare Visual 3D (V3D) data for FNOVA at UNC-CH", add_help=False)
 
 	input_group = parser.add_argument_group("Input Files")
 	input_group.add_argument("-d", "-df", "--demo-file", dest="demo_fn", metavar="demo.csv", type=str, action="store", help="The name of the CSV file containing demographics information. Column 1 must be the sample/subject id. Columns 4, 5, and 7 must be height (cm), mass (kg), and involved limb (0=Right, 1=Left), respectively. [default: data/demographics.csv]", default="data/demographics.csv", required=False)
-	input_group.add_argument("-i", "-id", "--input-dir", dest="input_dir", metavar="/path/to/input/dir", type=str, action="store", help="The directory where the input data files are located. This directory MUST contain one directory per condition. Each condition directory must contain files named after the pattern ${sample}_${condition}_normalized.txt. [default: data/input]", default="data/input", required=False)
+	input_group.add_argument("-i", "-id", "--input-dir", dest="input_dir", metavar="/path/to/input/dir", type=str, action="store", help="The directory where the input data files are located. This directory MUST contain one directory per condition. Each condition directory must contain files named after the pattern ${sample}_${condition}_normalized.txt. Files compressed with gzip, bzip2, or xz (named ${sample}_${condition}_normalized.txt.gz, .bz2, or .xz) are decompressed while they are read; an uncompressed file takes precedence over a compressed one. [default: data/input]", default="data/input", required=False)
 	input_group.add_argument("-s", "-sf", "--samples-file", dest="samples_fn", metavar="samples.list", type=str, action="store", help="The name of the file containing sample/subject identifiers. One id per line. [default: data/samples.list]", default="data/samples.list", required=False)
 
 	output_group = parser.add_argument_group("Output Files")
 	output_group.add_argument("-op", "--output-prefix", dest="output_fn_pfx", metavar="/out/dir/out_file_", type=str, action="store", help="The prefix of the output file name. This includes the path and filename. The actual output file will have the the condition and measurements sandwiched between this prefix and the suffix, like so: ${prefix}${condition}_{measurement}${suffix}. If the prefix is just a directory, be sure to include the trailing slash. [default: data/output/", default="data/output/", required=False)
 	output_group.add_argument("-os", "--output-suffix", dest="output_fn_sfx", metavar=".csv", type=str, action="store", help="The suffix of the output file name. This includes the leading period, if desired. The actual output file will have the the condition and measurements sandwiched between the prefix and this suffix, like so: ${prefix}${condition}_{measurement}${suffix}. [default: .csv", default=".csv", required=False)
 
+	output_group.add_argument("-W", "--long", dest="long", action="store_true", help="Also write all of the output (of each --variant) as one long-format table, ${prefix}long${suffix}, with one row per value and the columns condition, sample, trial, frame, measurement, and value. Trials and frames are numbered from 1. This cannot be combined with --stream.", required=False)
+	output_group.add_argument("-z", "--compress", dest="compression", metavar="gz|bz2|xz", type=str, choices=("gz", "bz2", "xz"), action="store", help="Compress the output files (per-condition and concatenated, for every --variant) while they are written, with gzip, bzip2, or xz. The extension (e.g., .gz) is appended to the output suffix(es). An output suffix that already ends with one of these extensions has the same effect without this option. With --concatenate-only, the per-condition output files are read back in with the same extension. [default: no compression]", default=None, required=False)
+	output_group.add_argument("-V", "--variant", dest="variants", metavar="'-op data/output/last/ -l'", type=str, action="append", help="Also produce another variant of the output from the same inputs, which are parsed only once for all variants. The value is a quoted set of options, as they would be given to a separate invocation: -op (required), -os, -n, -l, -L, -g, and -T. Options not given in a variant take their usual defaults; they are not inherited from the main options. Every other option (e.g., -D, -N, -R) applies to all variants. May be specified multiple times. This cannot be combined with --stream. [default: no variants]", default=[], required=False)
+
 	options_group = parser.add_argument_group("Options")
 	options_group.add_argument("-c", "-cf", "--conditions-file", dest="conditions_fn", metavar="data/conditions.list", type=str, action="store", help="The file name for the experimental conditions of the provided data, e.g., control, overload, etc. One condition is listed per line. [default: data/conditions.list]", default="data/conditions.list", required=False)
+	options_group.add_argument("-A", "--concatenate-only", dest="concatenate_only", action="store_true", help="By default, the per-condition output files are produced and then, unless -N is specified, concatenated from the output lines kept in memory while they were written. When this option is specified, no input files are processed. Instead, the existing per-condition output files (${prefix}${condition}_{measurement}${suffix}) are read back in and only the concatenated output files are written. This cannot be combined with -N.", required=False)
+	options_group.add_argument("--cache-dir", dest="cache_dir", metavar="/path/to/cache/dir", type=str, action="store", help="Keep a binary copy of every parsed input file (its header rows and all of its data as doubles) in this directory and memory-map it on later runs instead of parsing the text again. This pays off when the same inputs are processed repeatedly with different options (e.g., -n, -l, -L). An entry is rebuilt when the modification time or size of its input file changes. The directory is created if needed. This cannot be combined with --stream. [default: no cache]", default=None, required=False)
+	options_group.add_argument("--cache-size", dest="cache_size", metavar="MiB", type=int, action="store", help="When --cache-dir is used, the least recently used entries are removed at the end of the run until the cache is no larger than this. [default: 1024]", default=1024, required=False)
 	options_group.add_argument("-C", "-cc", "-Cc", "-CC", "--control-condition", dest="control_condition", metavar="control", type=str, action="store", help="The condition that is to be treated as the control. [default: control]", default="control", required=False)
 	options_group.add_argument("-D", "-DC", "-dc", "-Dc", "--duplicate-control", dest="dup_control", action="store_true", help="By default, the control condition will NOT be duplicated at the end of the file during horizontal concatenation (assuming horizontal concatenation is performed (see the -N option)). When this option is specified, the control condition will be duplicated at the end, occuring as many times as there are non-control conditions. If your control condition is not 'control', you need to specify --control-condition.", required=False)
+	options_group.add_argument("--diagnostics", dest="diagnostics_fn", metavar="diagnostics.json", type=str, action="store", help="Missing cells and samples with too few trials are summarized on stderr at the end of the run, with the missing cells of each input column given as ranges of csv rows. Also write every missing cell range, every short trial, and the fraction of \"NA\" output cells of each (condition, sample) to this file as JSON. [default: no diagnostics file]", default=None, required=False)
 	options_group.add_argument("-g", "-dg", "--downgrade", "--downhill", dest="downgrade", action="store_true", help="When the grade is zero (level ground) or positive (uphill), the LEFT knee values need to be negated. When the grade is negative (downhill), the RIGHT knee values need to be negated. By default, the grade is assumed to be non-negative.")
+	options_group.add_argument("-I", "--incremental", dest="incremental", action="store_true", help="Keep a manifest of the processed input files (their sizes and hashes), the demographics of each sample, and the options that affect the results (-n, -l, -L, -g, -T), together with the parsed result of each (condition, sample), in ${prefix}${suffix}.incremental (one per --variant). On a rerun, only the (condition, sample) units whose input file or demographics changed are parsed again; the cached results are reused for all others. Changing any of those options reparses everything. Missing cells and short trials are only reported for units that are actually parsed, but --max-missing checks every unit. This cannot be combined with --stream.", required=False)
+	options_group.add_argument("-j", "--jobs", dest="jobs", metavar="int", type=int, action="store", help="The number of worker processes used to parse the input files. Output is identical regardless of the number of jobs. [default: 1]", default=1, required=False)
 	options_group.add_argument("-l", "--last", dest="last_not_first", action="store_true", help="By default, the first n trials are used. Instead, use the last n trials.", required=False)
 	options_group.add_argument("-L", "--contralateral", dest="contralateral", action="store_true", help="By default, the involved limb is the limb of interest. When this option is specified, the uninvolved/contralateral limb is used instead. Note: this is very naively implemented. When the involved limb is read in from the demographics file, the value is flipped (0->1, 1->0).", required=False)
+	options_group.add_argument("--max-missing", dest="max_missing", metavar="fraction", type=float, action="store", help="Stop with an error as soon as the output of a (condition, sample) has a larger fraction of \"NA\" cells than this, counting both missing cells and the cells of missing trials (over all --variants). For example, 0.05 allows up to 5%% of the output of every sample to be \"NA\". [default: 1, i.e., never stop]", default=1.0, required=False)
 	options_group.add_argument("-n", "-nt", "--num-trials", dest="num_trials", metavar="int", type=int, action="store", help="The number of trials (stances) to use. [default: 5]", default=5, required=False)
 	options_group.add_argument("-N", "-NC", "-nc", "-Nc", "--no-concatenate", dest="concatenate", action="store_false", help="By default, the output files for each condition are combined into an extra output file all horizontally concatenated together, optionally (-D) with the control condition occuring as many time as there are non-control conditions. Specify this option and the concatenated files will be skipped. You need not specify --control-condition when using this option because it (--control-condition) will be ignored. Similarly, the use of --duplicate-control will be ignored if this option is specified.", required=False)
 	options_group.add_argument("-P", "-PC", "-pc", "-Pc", "--per-condition-samples-files", dest="per_cond_samples_files", action="store_true", help="By default, the samples file (--samples-file) is a single file that applies to all conditions. If some samples were not collected or were low-quality for a particular condition, that sample should be skipped for the given condition. Accordingly, individual samples files must be provided for each condition. Instead of a single samples file (e.g., at data/samples.list), separate sample files (presumabely, though not necessarily, with different samples listed in one or more) must be provided (e.g., at data/input/cond1/samples.list, data/input/cond2/samples.list, ..., data/input/condN/samples.list). Currently, if this option (-P) is used, the program requires the individual samples files to be called 'samples.list' and be located in the respective condition directories (one condition directory per condition located in data/input (or wherever -i points to)).", required=False)
+	options_group.add_argument("--profile", dest="profile_fn", metavar="reformat.prof", type=str, action="store", help="Run the whole pipeline under cProfile and dump the profile to this file when done, e.g., to be viewed with 'python -m pstats reformat.prof'. With --jobs, only the main process is profiled; the parsing done in the worker processes is not. [default: no profile]", default=None, required=False)
+	options_group.add_argument("-R", "--reorient", dest="transformations", metavar="'X=>-Y'", type=str, nargs="+", action="store", help="Reorient the input files in memory while they are read, without writing _reoriented copies (see reorient.py). The xyz header row (row 5) is relabeled and the values of relabeled columns are negated as requested. Transformations must match this regex: /^[XYZ]=>-?[XYZ]$/, e.g., --reorient 'X=>-Y' 'Y=>X'. Unlike reorient.awk, values keep their full precision and missing cells stay missing. [default: no reorientation]", default=None, required=False)
+	options_group.add_argument("-S", "--stream", dest="stream", action="store_true", help="By default, every frame of every sample in a condition is held in memory before the output files for that condition are written. When this option is specified, all sample files for a condition are opened together and read frame by frame in lockstep, and each output row is written as soon as it is complete. Memory use is then proportional to the number of columns rather than the number of frames. Note: every sample file in a condition is open at once, so the per-process open file limit must exceed the number of samples in a condition. This option cannot be combined with --jobs.", required=False)
+	options_group.add_argument("--stats", dest="show_stats", action="store_true", help="When done, print a summary of the run to stderr: the wall time of each stage (argument validation, demographics, lists, parsing, transposing into the output buffers, writing, concatenation, etc.), the time spent in each stage of parsing summed over all (condition, sample) units, the numbers of rows, bytes, and cells read and of rows and bytes written, the number of cells read per second, the peak memory use (RSS), and the slowest unit.", required=False)
+	options_group.add_argument("--stats-file", dest="stats_fn", metavar="stats.json", type=str, action="store", help="When done, write the same information as --stats, plus the timings and counters of every (condition, sample) unit, to this file as JSON. With --stream, the samples of a condition are read together, so there are no per-unit timings. [default: no report]", default=None, required=False)
 	options_group.add_argument("-T", "--not-treadmill", dest="treadmill", action="store_false", help="vGRF values are pulled from columns FP1 (right foot) and FP2 (left foot) when collected on a treadmill. If overground (i.e., not treadmill) data is collected, the columns are FP3 (right foot) and FP2 (left foot). Specifying this option will cause the program to search for FP3 columns instead of FP1 columns.")
 	
 	misc_group = parser.add_argument_group("Misc", )
+	misc_group.add_argument("--dry-run", dest="dry_run", action="store_true", help="Validate everything and print the plan of the work (the conditions, their samples and input files, and the output files with their estimated sizes) without reading any input file in full or creating any file or directory. The number of frames of each condition is estimated from the size and the first 256 KiB (decompressed; up to one more compressed block for a compressed file) of the input file of its first sample, or counted if that file is smaller.", required=False)
 	misc_group.add_argument("-h", "--help", action="help", help="Show this help message and exit")
 	misc_group.add_argument("-v", "--version", action="version", version="%(prog)s 0.2.1-beta", help="Show version number and exit")
 
@@ -50,109 +637,150 @@ def handleArgs():
 		sys.stderr.write(f"ERROR: It makes sense to analyze one ore more trials. {args.num_trials} is not a sane choice.\n")
 		sys.exit(1)
 	
-	# ensure input directory exists
-	if not Path(args.input_dir).is_dir():
-		print(f"ERROR: {args.input_dir} either does not exist or is not a directory (or link to a directory).", file=sys.stderr)
+	# validate the fraction of missing data allowed
+	if not 0 <= args.max_missing <= 1:
+		print(f"ERROR: The fraction of missing data allowed must be between 0 and 1. {args.max_missing} is not a sane choice.", file=sys.stderr)
 		sys.exit(1)
 
-	# ensure input demo exists
-	if not Path(args.demo_fn).is_file():
-		print(f"ERROR: {args.demo_fn} either does not exist or is not a regular file.", file=sys.stderr)
+	# validate number of jobs
+	if args.jobs < 1:
+		print(f"ERROR: At least one job is required to do any work. {args.jobs} is not a sane choice.", file=sys.stderr)
 		sys.exit(1)
 
-	# ensure conditions file exists and has unique entries and
-	# one condition directory is present inside the input_dir for each condition
-	# and the control condition is in the conditions file
-	#	exists
-	if not Path(args.conditions_fn).is_file():
-		print(f"ERROR: {args.conditions_fn} either does not exist or is not a regular file.", file=sys.stderr)
+	# streaming reads the files of a condition together in a single process
+	if args.stream and args.jobs > 1:
+		print("ERROR: --stream reads the files of each condition in lockstep in a single process and cannot be combined with --jobs.", file=sys.stderr)
 		sys.exit(1)
 
-	#	unique entries
-	cond_l = parseListFileAsList(args.conditions_fn)
-	if len(cond_l) != len(set(cond_l)):
-		print(f"ERROR: {args.conditions_fn} has duplicate entries.", file=sys.stderr)
+	# concatenating is the only thing done by --concatenate-only
+	if args.concatenate_only and not args.concatenate:
+		print("ERROR: --concatenate-only and --no-concatenate together would do nothing.", file=sys.stderr)
 		sys.exit(1)
-	
-	#	dirs exist in input_dir
-	for cond in cond_l:
-		cond_path = Path(args.input_dir) / cond
-		if not cond_path.is_dir():
-			print(f"ERROR: {cond_path} either does not exist or is not a directory (or link to a directory).", file=sys.stderr)
-			sys.exit(1)
 
-	# 	control condition in conditions file (if required)
-	if args.concatenate and args.dup_control:
-		control_in_conditions_file = False
-		for condition in cond_l:
-			if condition == args.control_condition:
-				control_in_conditions_file = True
-				break
-		if not control_in_conditions_file:
-			print(f"ERROR: control condition ({control}) was not in {args.condition_fn}.", file=sys.stderr)
+	# the long-format table is written from the buffers of every condition, which streaming never keeps
+	if args.long and args.stream:
+		print("ERROR: --long is written from every condition held in memory, which --stream never keeps, so the two cannot be combined.", file=sys.stderr)
+		sys.exit(1)
+
+	# incremental results are per-sample buffers, which streaming never builds
+	if args.incremental and args.stream:
+		print("ERROR: --incremental keeps the parsed result of each sample, which --stream never builds, so the two cannot be combined.", file=sys.stderr)
+		sys.exit(1)
+
+	# the cache holds parsed files, which streaming never builds
+	if args.cache_dir is not None:
+		if args.stream:
+			print("ERROR: --cache-dir keeps parsed copies of whole input files, which --stream never builds, so the two cannot be combined.", file=sys.stderr)
 			sys.exit(1)
-	
-	# ensure input samples file(s) exist(s) and has(have) unique entries
-	#	multiple samples files
-	if args.per_cond_samples_files:
-		for cond in cond_l:
-			samplefn = Path(args.input_dir) / cond / "samples.list"
-			#	exists
-			if not samplefn.is_file():
-				print(f"ERROR: {samplefn} either does not exist or is not a regular file.", file=sys.stderr)
+		if args.cache_size < 1:
+			print(f"ERROR: The cache must be allowed at least 1 MiB. {args.cache_size} is not a sane choice.", file=sys.stderr)
+			sys.exit(1)
+		try:
+			if not args.dry_run: # a dry run creates nothing
+				Path(args.cache_dir).mkdir(parents=True, exist_ok=True)
+		except OSError as e:
+			print(f"ERROR: {args.cache_dir} could not be created as the cache directory: {e.strerror}.", file=sys.stderr)
+			sys.exit(1)
+
+	# validate transformations
+	if args.transformations is not None:
+		from reorient import TRANSFORMATION_RE
+
+		for transformation in args.transformations:
+			if not TRANSFORMATION_RE.match(transformation):
+				print(f"ERROR: {transformation} is not a transformation. Transformations must match this regex: /^[XYZ]=>-?[XYZ]$/.", file=sys.stderr)
 				sys.exit(1)
 
-			#	unique entries
-			samples = parseSamplesFile(str(samplefn))
-			if len(samples) != len(set(samples)):
-				print(f"ERROR: {samplefn} has duplicate entries.", file=sys.stderr)
+	# ensure input demo exists
+	if not Path(args.demo_fn).is_file():
+		print(f"ERROR: {args.demo_fn} either does not exist or is not a regular file.", file=sys.stderr)
+		sys.exit(1)
+
+	# discover the conditions, the samples of each condition, and their input files in a single pass (one directory
+	# scan per condition); this ensures the conditions file and samples file(s) exist and have unique entries, one
+	# condition directory is present inside the input_dir for each condition, and the control condition is in the
+	# conditions file (if required)
+	try:
+		cohort = loadCohort(args.demo_fn, args.conditions_fn, args.input_dir, samples_fn=args.samples_fn, per_cond_samples_files=args.per_cond_samples_files, control_condition=args.control_condition, force_control_last=(args.concatenate and args.dup_control), transformations=args.transformations)
+	except ReformatError as e:
+		print(f"ERROR: {e}", file=sys.stderr)
+		sys.exit(1)
+
+	# parse the variants, each as if its options were given to a separate invocation
+	variants = []
+	if len(args.variants) > 0:
+		import shlex
+
+		variant_parser = argparse.ArgumentParser(prog="reformat.py --variant", add_help=False)
+		variant_parser.add_argument("-op", "--output-prefix", dest="output_fn_pfx", type=str, action="store", required=True)
+		variant_parser.add_argument("-os", "--output-suffix", dest="output_fn_sfx", type=str, action="store", default=".csv", required=False)
+		variant_parser.add_argument("-g", "-dg", "--downgrade", "--downhill", dest="downgrade", action="store_true")
+		variant_parser.add_argument("-l", "--last", dest="last_not_first", action="store_true", required=False)
+		variant_parser.add_argument("-L", "--contralateral", dest="contralateral", action="store_true", required=False)
+		variant_parser.add_argument("-n", "-nt", "--num-trials", dest="num_trials", type=int, action="store", default=5, required=False)
+		variant_parser.add_argument("-T", "--not-treadmill", dest="treadmill", action="store_false")
+
+		for variant in args.variants:
+			vargs = variant_parser.parse_args(shlex.split(variant))
+			if vargs.num_trials < 1:
+				print(f"ERROR: It makes sense to analyze one ore more trials. {vargs.num_trials} (in --variant '{variant}') is not a sane choice.", file=sys.stderr)
 				sys.exit(1)
+			variants.append( Configuration(vargs.output_fn_pfx, vargs.output_fn_sfx, num_trials=vargs.num_trials, last_not_first=vargs.last_not_first, contralateral=vargs.contralateral, downgrade=vargs.downgrade, treadmill=vargs.treadmill) )
 
-	#	single samples file
-	else:
-		#	exists
-		if not Path(args.samples_fn).is_file():
-			print(f"ERROR: {args.samples_fn} either does not exist or is not a regular file.", file=sys.stderr)
+		#	variants are derived from one parse of the inputs, in memory
+		if args.stream:
+			print("ERROR: --variant derives every configuration from one in-memory parse of the inputs, which --stream never keeps, so the two cannot be combined.", file=sys.stderr)
 			sys.exit(1)
 
-		#	unique entries
-		samples = parseListFileAsList(args.samples_fn)
-		if len(samples) != len(set(samples)):
-			print(f"ERROR: {args.samples_fn} has duplicate entries.", file=sys.stderr)
+		#	every configuration needs its own output files
+		outputs = [ (args.output_fn_pfx, args.output_fn_sfx) ] + [ (variant.outfnpre, variant.outfnsuf) for variant in variants ]
+		if len(outputs) != len(set(outputs)):
+			print("ERROR: Each --variant must have a different output prefix or suffix than the other variants and the main options, otherwise their output files would overwrite each other.", file=sys.stderr)
 			sys.exit(1)
 
-	# ensure output suffix directory exists
-	parent = ''
-	if len(args.output_fn_pfx) > 0 and args.output_fn_pfx[-1] == '/':
-		parent = Path(args.output_fn_pfx).resolve()
-	else:
-		parent = Path(PurePath(Path(args.output_fn_pfx).resolve()).parent)
-
-	if not parent.is_dir():
-		print(f"ERROR: {parent} either does not exist or is not a directory. The path was extracted from \"{args.output_fn_pfx}\".", file=sys.stderr)
-		sys.exit(1)
-	
-	return args.samples_fn, args.demo_fn, args.conditions_fn, args.input_dir, args.output_fn_pfx, args.output_fn_sfx, args.num_trials, args.downgrade, args.last_not_first, args.concatenate, args.dup_control, args.control_condition, args.per_cond_samples_files, args.treadmill, args.contralateral
+	# compress the output files (of every configuration), if requested
+	if args.compression is not None:
+		for output_fn_sfx in [args.output_fn_sfx] + [ variant.outfnsuf for variant in variants ]:
+			if output_fn_sfx.endswith(COMPRESSION_EXTENSIONS):
+				print(f"ERROR: The output suffix {output_fn_sfx} already selects a compression, so --compress is not needed.", file=sys.stderr)
+				sys.exit(1)
+		args.output_fn_sfx += f".{args.compression}"
+		for variant in variants:
+			variant.outfnsuf += f".{args.compression}"
+
+	# ensure the directories of the instrumentation reports exist
+	for report_fn in (args.diagnostics_fn, args.stats_fn, args.profile_fn):
+		if report_fn is not None and not Path(report_fn).resolve().parent.is_dir():
+			print(f"ERROR: {Path(report_fn).resolve().parent} either does not exist or is not a directory. The path was extracted from \"{report_fn}\".", file=sys.stderr)
+			sys.exit(1)
 
-def transpose2Dlist(rows):
-	# we assume this is not a sparse matrix
+	# ensure output suffix directory exists (for every configuration)
+	for output_fn_pfx in [args.output_fn_pfx] + [ variant.outfnpre for variant in variants ]:
+		parent = ''
+		if len(output_fn_pfx) > 0 and output_fn_pfx[-1] == '/':
+			parent = Path(output_fn_pfx).resolve()
+		else:
+			parent = Path(PurePath(Path(output_fn_pfx).resolve()).parent)
 
-	if len(rows) == 0:
-		return []
-	elif len(rows) > 1:
-		firstlen = len(rows[0])
-		for row in rows[1:]:
-			if len(row) != firstlen:
-				print("ERROR: transpose2Dlist function assumes non-sparse matrix", file=sys.stderr)
-				sys.exit(1)
+		if not parent.is_dir():
+			print(f"ERROR: {parent} either does not exist or is not a directory. The path was extracted from \"{output_fn_pfx}\".", file=sys.stderr)
+			sys.exit(1)
 	
-	x = [ [] for _ in rows[0] ]
+	# the main options form the first configuration, followed by any variants
+	args.configs = [ Configuration(args.output_fn_pfx, args.output_fn_sfx, num_trials=args.num_trials, last_not_first=args.last_not_first, contralateral=args.contralateral, downgrade=args.downgrade, treadmill=args.treadmill) ] + variants
+
+	# ensure every input file exists and every sample is in the demographics file before any input file is
+	# read (only the output files are read with --concatenate-only)
+	if not args.concatenate_only:
+		try:
+			cohort.validate(args.configs)
+		except ReformatError as e:
+			print(f"ERROR: {e}", file=sys.stderr)
+			sys.exit(1)
 
-	for c in range(0, len(rows[0]), 1):
-		for r in range(0,len(rows), 1):
-			x[c].append(rows[r][c])
+	args.cohort = cohort
 
-	return x
+	return args
 
 def parseDemographicsFile(ifn, contralateral=False):
 	dem = {}
@@ -193,7 +821,7 @@ def parseConditionsFile(condition_fn, control_condition, force_control_last=True
 	# extract the conditions
 	l = sorted(parseListFileAsList(condition_fn))
 
-	if force_control_last:
+	if force_control_last and control_condition in l:
 		# ensure control_condition is last item
 		l.remove(control_condition)
 		l.append(control_condition)
@@ -201,8 +829,141 @@ def parseConditionsFile(condition_fn, control_condition, force_control_last=True
 	# return
 	return l
 
-def extractIndicesAndInversionDecision(measurement,inv_limb,data_types,xyzs,downgrade=False,treadmill=True):
+def loadCohort(demo_fn="data/demographics.csv", conditions_fn="data/conditions.list", input_dir="data/input", samples_fn="data/samples.list", per_cond_samples_files=False, control_condition="control", force_control_last=False, transformations=None):
+	# read the conditions and the samples of each condition (from samples_fn, or from ${input_dir}/${condition}/samples.list
+	# if per_cond_samples_files) and scan each condition directory once for the input files; transformations are as for
+	# reorient.py, e.g., ['X=>-Y', 'Y=>X']; raises ReformatError if a list or directory is missing or a list has duplicates
+	if not os.path.isdir(input_dir):
+		raise ReformatError(f"{input_dir} either does not exist or is not a directory (or link to a directory).")
+
+	if not os.path.isfile(conditions_fn):
+		raise ReformatError(f"{conditions_fn} either does not exist or is not a regular file.")
+
+	conditions = parseConditionsFile(conditions_fn, control_condition, force_control_last=force_control_last)
+	if len(conditions) != len(set(conditions)):
+		raise ReformatError(f"{conditions_fn} has duplicate entries.")
+
+	if force_control_last and control_condition not in conditions:
+		raise ReformatError(f"control condition ({control_condition}) was not in {conditions_fn}.")
 
+	listings = scanConditionDirs(input_dir, conditions)
+	for condition in conditions:
+		if listings[condition] is None:
+			raise ReformatError(f"{os.path.join(input_dir, condition)} either does not exist or is not a directory (or link to a directory).")
+
+	condition_samples = {}
+	samples = []
+	if not per_cond_samples_files:
+		if not os.path.isfile(samples_fn):
+			raise ReformatError(f"{samples_fn} either does not exist or is not a regular file.")
+		samples = parseSamplesFile(samples_fn)
+		if len(samples) != len(set(samples)):
+			raise ReformatError(f"{samples_fn} has duplicate entries.")
+
+	for condition in conditions:
+		if per_cond_samples_files:
+			samplefn = os.path.join(input_dir, condition, "samples.list")
+			if "samples.list" not in listings[condition]:
+				raise ReformatError(f"{samplefn} either does not exist or is not a regular file.")
+			samples = parseSamplesFile(samplefn)
+			if len(samples) != len(set(samples)):
+				raise ReformatError(f"{samplefn} has duplicate entries.")
+		condition_samples[condition] = samples
+
+	return Cohort(input_dir, conditions, condition_samples, demo_fn, control_condition=control_condition, transformations=transformations, listings=listings)
+
+def scanConditionDirs(input_dir, conditions):
+	# one directory scan per condition: condition -> {file name: size} of the input files and samples list in
+	# its directory (links are followed), or None if the condition has no directory
+	listings = {}
+	for condition in conditions:
+		try:
+			with os.scandir(os.path.join(input_dir, condition)) as entries:
+				listings[condition] = { entry.name: entry.stat().st_size for entry in entries if (entry.name == "samples.list" or entry.name.endswith(INPUT_SUFFIXES)) and entry.is_file() }
+		except (FileNotFoundError, NotADirectoryError):
+			listings[condition] = None
+
+	return listings
+
+def extractConditions(cohort, configs, measurements=MEASUREMENTS, jobs=1, cache_dir=None, incremental=False, max_missing=1.0, stats=None, diagnostics=None, layouts_seen=None):
+	# parse every (condition, sample) unit of the cohort once for all configurations and yield (condition, outputs) as soon as
+	# each condition is complete, where outputs holds one {measurement: FrameBuffer} per configuration; raises ReformatError
+	# if the samples of a condition differ in their number of frames or too much of a sample is missing (see failOnMissing)
+	if stats is None:
+		stats = Stats()
+	if diagnostics is None:
+		diagnostics = Diagnostics()
+	if layouts_seen is None:
+		layouts_seen = {}
+
+	cohort.validate(configs)
+	units = cohort.units(configs, measurements, cache_dir)
+	if incremental: # only the units that changed since the last run are parsed
+		caches = [ ResultCache(config.outfnpre, config.outfnsuf, dict(config.options(), reorient=cohort.transformations)) for config in configs ]
+		results = cachedUnitResults(units, jobs, caches, stats=stats, diagnostics=diagnostics)
+	else:
+		results = parseSampleUnits(units, jobs, stats=stats, diagnostics=diagnostics)
+
+	for condition in cohort.conditions:
+		samples = cohort.condition_samples[condition]
+
+		# one buffer per measurement and configuration, allocated once the first sample reveals the number of frames
+		condition_outputs = [ {} for config in configs ]
+		for measurement in measurements:
+			for config,output in zip(configs, condition_outputs):
+				output[measurement] = FrameBuffer(0, config.num_trials * len(samples))
+
+		# results arrive in the same order the units were listed
+		for s,sample in enumerate(samples):
+			with stats.stage("parse"): # waiting for the unit, which may be parsed by a worker process
+				unit_results = next(results)
+			noteHeaderLayout(layouts_seen, unit_results[0][1], condition, sample)
+
+			with stats.stage("missing"):
+				for config,(columns, layout) in zip(configs, unit_results):
+					diagnostics.addCells(condition, sample, *countMissingCells(columns, measurements))
+			failOnMissing(diagnostics, condition, sample, max_missing)
+
+			with stats.stage("transpose"):
+				for config,output,(columns, layout) in zip(configs, condition_outputs, unit_results):
+					fillFrameBuffers(output, columns, s, samples, condition, config.num_trials, measurements)
+
+		yield condition, condition_outputs
+
+	if incremental:
+		with stats.stage("incremental manifest"):
+			for cache in caches:
+				cache.save()
+
+def extract(cohort, configs=None, measurements=MEASUREMENTS, **options):
+	# parse the whole cohort into memory, once for all configurations (by default, the default Configuration); returns one
+	# Extraction per configuration; options are passed on to extractConditions (jobs, cache_dir, max_missing, stats, etc.)
+	if configs is None:
+		configs = [ Configuration() ]
+
+	extractions = [ Extraction(config, measurements, cohort.condition_samples) for config in configs ]
+	for condition,condition_outputs in extractConditions(cohort, configs, measurements, **options):
+		for extraction,output in zip(extractions, condition_outputs):
+			extraction.buffers[condition] = output
+
+	return extractions
+
+def openText(fn, mode='r'):
+	# open a text file, (de)compressing it on the fly if its name ends with one of COMPRESSION_EXTENSIONS
+	if fn.endswith(".gz"):
+		import gzip
+		return gzip.open(fn, mode + 't', compresslevel=6) # the level of the gzip command; 9 is several times slower
+	elif fn.endswith(".bz2"):
+		import bz2
+		return bz2.open(fn, mode + 't')
+	elif fn.endswith(".xz"):
+		import lzma
+		return lzma.open(fn, mode + 't')
+	else:
+		return open(fn, mode)
+
+def measurementColumn(measurement,inv_limb,downgrade=False,treadmill=True):
+	# the data type and direction holding a measurement, and whether its values are inverted
 	vGRF_right_colname = "FP1" if treadmill else "FP2"
 	vGRF_left_colname = "FP2" if treadmill else "FP3"
 
@@ -240,171 +1001,756 @@ def extractIndicesAndInversionDecision(measurement,inv_limb,data_types,xyzs,down
 	if ( measurement == "frontang" and field == (field_limb + "KNEEANGLE") ) or ( measurement == "frontmom" and field == (field_limb + "KNEEMOMENT") ):
 		invert = True
 
-	return [i for i,data_type,xyz in zip(range(0,len(data_types),1),data_types,xyzs) if data_type == field and xyz == direction], invert
+	return field, direction, invert
 
-def writeConcatenatedOutput(outfnpre, outfnsuf, measurements, conditions, control_cond, dup_control):
+def headerLayout(data_types, xyzs):
+	# files with identical header rows share one (memoized) layout
+	import hashlib
 
-	non_control_conditions = 0
-	if dup_control: # this if could be moved to the two times we extend the lines list instead if we wanted to use non_control_conditions for any other purpose
-		for condition in conditions:
-			if condition != control_cond:
-				non_control_conditions += 1
+	fingerprint = hashlib.sha1(('\t'.join(data_types) + '\n' + '\t'.join(xyzs)).encode()).hexdigest()[:12]
+	if fingerprint not in HEADER_LAYOUTS:
+		HEADER_LAYOUTS[fingerprint] = HeaderLayout(fingerprint, data_types, xyzs)
+
+	return HEADER_LAYOUTS[fingerprint]
+
+def extractIndicesAndInversionDecision(measurement,inv_limb,data_types,xyzs,downgrade=False,treadmill=True):
+	return headerLayout(data_types, xyzs).resolve(measurement, inv_limb, downgrade=downgrade, treadmill=treadmill)
+
+def readHeader(ifd):
+	# the five header lines of a V3D normalized file; only the data types (row 2) and the XYZ directions (row 5) matter
+	ifd.readline() # skip first line
+	data_types = ifd.readline().rstrip('\n').upper().replace(' ', '').split('\t')
+	ifd.readline() # skip third line
+	ifd.readline() # skip fourth line
+	xyzs = ifd.readline().rstrip('\n').upper().split('\t')
+
+	return data_types, xyzs
+
+def selectTrialIndices(condition, sample, dem, measurements, num_trials, data_types, xyzs, downgrade=False, last_not_first=False, treadmill=True, diagnostics=None):
+	# returns the column indices and inversion decision of each measurement, and the id of the header layout;
+	# measurements with too few trials are recorded in diagnostics, if given
+	layout = headerLayout(data_types, xyzs)
+	indices = {}
+	inversions = {}
 
 	for measurement in measurements:
-		all_input_filenames = [ f"{outfnpre}{condition}_{measurement}{outfnsuf}" for condition in conditions ]
-		all_input_filehandles = [ open(input_fn, 'r') for input_fn in all_input_filenames ]
-		lines = [ ifh.readline() for ifh in all_input_filehandles ]
-		if non_control_conditions > 1:
-			lines.extend( [lines[-1] * (non_control_conditions - 1)] )
+		indices[measurement], inversions[measurement] = layout.resolve(measurement, dem["inv_limb"], downgrade=downgrade, treadmill=treadmill)
 
-		# write the concatenated output file (all non-control conditions then the control
-		# conditions repeated as many times are there are non-control conditions)
-		outfn = f"{outfnpre}all_{measurement}{outfnsuf}"
-		with open(outfn, 'w') as ofd:
-			while all(lines): # since non-empty strings are truthy, this will continue as long as all files provide lines
-				ofd.write(','.join(lines).replace('\n', '') + '\n')
-				lines = [ ifh.readline() for ifh in all_input_filehandles ]
-				if non_control_conditions > 1:
-					lines.extend( [lines[-1] * (non_control_conditions - 1)] )
+		# test if enough trials
+		if len(indices[measurement]) >= num_trials:
+			if last_not_first:
+				indices[measurement] = indices[measurement][-num_trials:]
+			else:
+				indices[measurement] = indices[measurement][:num_trials]
+		elif diagnostics is not None:
+			diagnostics.addShortTrials(condition, sample, measurement, len(indices[measurement]), num_trials)
 
-		# close the open input files
-		for ifh in all_input_filehandles:
-			ifh.close()
+	return indices, inversions, layout.id
 
-def stringify(x):
-	if not x is None:
-		return str(x)
-	else:
-		return "NA"
+def reorientColumns(xyzs, reorientation):
+	# relabel the xyz header row in memory, as reorient.py/reorient.awk would on disk; returns
+	# the new row and the multiplier (1 or -1) of every column, or None if nothing is reoriented
+	if reorientation is None:
+		return xyzs, None
 
-# ------------- MAIN ----------------------------- ||
-if __name__ == "__main__":
-	
-	# handle the arguments to the script
-	samplefn, demfn, condfn, infdir, outfnpre, outfnsuf, num_trials, downgrade, last_not_first, write_concatenation, dup_control, control_cond, per_cond_sample_files, treadmill, contralateral = handleArgs()
+	from reorient import reorientHeader
 
-	#	import pathlib, if needed, based on the arguments provided
-	if per_cond_sample_files:
-		from pathlib import Path,PurePath
+	return reorientHeader(xyzs, *reorientation)
 
-	# parse the samples file, save as list of samples
-	samples = [] if per_cond_sample_files else parseSamplesFile(samplefn)
+def measurementScale(measurement, dem, inverted):
+	# values are divided by denom and then multiplied by invert
+	invert = -1 if inverted else 1
 
-	# parse the demographics file, save in nested dictionary structure
-	demdict = parseDemographicsFile(demfn, contralateral=contralateral)
+	denom = 1 # angs
+	if measurement == "vgrf":
+		denom = float(dem["mass"])
+	elif measurement == "sagmom" or measurement == "frontmom":
+		denom = float(dem["mass"]) * dem["height"]
 
-	# parse the conditions file, save as list of conditions
-	conditions = parseConditionsFile(condfn, control_cond, force_control_last=(write_concatenation and dup_control) )
+	return denom, invert
 
-	# loop through input files
-	measurements = [ "vgrf", "sagang", "frontang", "sagmom", "frontmom" ]
+def missingRows(values):
+	# the 0-based rows of a column that are missing (NaN); NaN propagates through a sum, so most columns are checked at C speed
+	total = sum(values)
+	if total == total:
+		return []
 
-	for condition in conditions:
-		output = {}
+	return [ row for row,v in enumerate(values) if v != v ]
+
+def countMissingCells(columns, measurements):
+	# the number of "NA" cells and of all cells in the output of one unit
+	na = 0
+	total = 0
+	for measurement in measurements:
+		for values in columns[measurement]:
+			na += len(missingRows(values))
+			total += len(values)
+
+	return na, total
+
+def parseSample(ifn, condition, sample, measurements, settings, cache_dir=None, reorientation=None, stats=None, diagnostics=None):
+	# settings holds one (demographics, Configuration) pair per output variant; the file is read once, keeping
+	# the columns any of them selects, and one (output, header layout id) result is returned per pair
+	if stats is None:
+		stats = Stats()
+	if diagnostics is None:
+		diagnostics = Diagnostics()
+
+	if cache_dir is not None:
+		with CachedV3DFile(ifn, cache_dir) as v3d:
+			with stats.stage("header"):
+				xyzs, multipliers = reorientColumns(v3d.xyzs, reorientation)
+				selections = selectSettingsIndices(condition, sample, measurements, settings, v3d.data_types, xyzs, diagnostics=diagnostics)
+
+			with stats.stage("read"):
+				num_frames = v3d.num_frames
+				cells = v3d.columns(sorted(set(j for indices,inversions,layout in selections for measurement in measurements for j in indices[measurement])))
+				stats.count("bytes read", 8 * num_frames * len(cells)) # only the selected columns are touched
+	else:
+		with openText(ifn) as ifd:
+			with stats.stage("header"):
+				data_types, xyzs = readHeader(ifd)
+				xyzs, multipliers = reorientColumns(xyzs, reorientation)
+				selections = selectSettingsIndices(condition, sample, measurements, settings, data_types, xyzs, diagnostics=diagnostics)
+
+			with stats.stage("read"):
+				# read only the selected columns of each line (splitting stops after the last of them)
+				selected = sorted(set(j for indices,inversions,layout in selections for measurement in measurements for j in indices[measurement]))
+				if selected:
+					getter = itemgetter(*selected) if len(selected) > 1 else (lambda fields, j=selected[0]: (fields[j],))
+					maxsplit = selected[-1] + 1
+					rows = [ getter(line.rstrip('\n').split('\t', maxsplit)) for line in ifd ]
+					num_frames = len(rows)
+					cells = {}
+					for j,column in zip(selected, zip(*rows)):
+						cells[j] = array('d', [ float(x) if x else NAN for x in column ])
+					del rows
+				else:
+					num_frames = sum(1 for line in ifd)
+					cells = {}
+				stats.count("bytes read", os.path.getsize(ifn)) # as stored, i.e., compressed if the file is
+
+	stats.count("input files", 1)
+	stats.count("rows read", num_frames)
+	stats.count("cells read", num_frames * len(cells))
+
+	# record the missing cells of every selected column (whichever configuration selected it)
+	with stats.stage("missing"):
 		for measurement in measurements:
-			output[measurement] = []
+			for j in sorted(set(j for indices,inversions,layout in selections for j in indices[measurement])):
+				rows = missingRows(cells[j])
+				if rows:
+					diagnostics.addMissing(condition, sample, measurement, j, rows)
+
+	# negate the columns whose direction was reoriented with a sign change
+	if multipliers is not None:
+		with stats.stage("reorient"):
+			for j in cells:
+				if multipliers[j] == -1:
+					cells[j] = array('d', [ -v for v in cells[j] ])
+
+	results = []
+	with stats.stage("scale"):
+		for (dem, config),(indices, inversions, layout) in zip(settings, selections):
+			output = scaleSampleColumns(measurements, config.num_trials, dem, indices, inversions, cells, num_frames)
+			results.append( (output, layout) )
+
+	return results
+
+def selectSettingsIndices(condition, sample, measurements, settings, data_types, xyzs, diagnostics=None):
+	selections = []
+	for dem,config in settings:
+		selections.append( selectTrialIndices(condition, sample, dem, measurements, config.num_trials, data_types, xyzs, downgrade=config.downgrade, last_not_first=config.last_not_first, treadmill=config.treadmill, diagnostics=diagnostics) )
+
+	return selections
+
+def scaleSampleColumns(measurements, num_trials, dem, indices, inversions, cells, num_frames):
+	# returns one array (column) per trial for each measurement; missing values are NaN
+	output = {}
+	for measurement in measurements:
+		output[measurement] = [ None for x in range(0,num_trials,1) ]
 
-		
-		if per_cond_sample_files:
-			samplefn = Path(infdir) / condition / "samples.list"
-			samples = parseSamplesFile(str(samplefn))
+	# normalize and invert each selected column as a whole
+	for measurement in measurements:
+		denom, invert = measurementScale(measurement, dem, inversions[measurement])
+
+		for i,j in enumerate(indices[measurement]):
+			values = cells[j]
+			if denom != 1 or invert != 1:
+				values = array('d', [ v / denom * invert for v in values ])
+			output[measurement][i] = values
+
+		for i in range(len(indices[measurement]), num_trials, 1):
+			output[measurement][i] = array('d', [NAN]) * num_frames
+
+	return output
+
+def evictCacheEntries(cache_dir, budget, stale_tmp_seconds=3600):
+	# remove the least recently used cache entries until the cache fits in budget bytes; partial entries (.tmp) count
+	# too, and those left by interrupted builds (not written to for stale_tmp_seconds) are always removed
+	entries = []
+	for entry in os.scandir(cache_dir):
+		if entry.name.endswith((".v3d", ".tmp")) and entry.is_file():
+			st = entry.stat()
+			if entry.name.endswith(".tmp") and time.time() - st.st_mtime > stale_tmp_seconds:
+				os.remove(entry.path)
+				continue
+			entries.append( (st.st_mtime_ns, st.st_size, entry.path) )
+
+	total = sum(size for mtime,size,path in entries)
+	for mtime,size,path in sorted(entries):
+		if total <= budget:
+			break
+		os.remove(path)
+		total -= size
+
+def hashFile(ifn):
+	import hashlib
+
+	h = hashlib.sha256()
+	with open(ifn, 'rb') as ifd:
+		for chunk in iter(lambda: ifd.read(1 << 20), b''):
+			h.update(chunk)
+
+	return h.hexdigest()
+
+def noteHeaderLayout(layouts_seen, layout, condition, sample):
+	# make header drift between files visible: report every layout that differs from the ones seen so far
+	if layout is None or layout in layouts_seen:
+		return
+
+	if layouts_seen:
+		first_layout, (first_condition, first_sample) = next(iter(layouts_seen.items()))
+		print(f"NOTE: {condition} {sample} has a different header layout ({layout}) than {first_condition} {first_sample} ({first_layout}).", file=sys.stderr)
+
+	layouts_seen[layout] = (condition, sample)
+
+def parseSampleUnit(unit):
+	# returns the parsed output of the unit, its Stats and Diagnostics, and how long it took
+	stats = Stats()
+	diagnostics = Diagnostics()
+	start = time.perf_counter()
+	results = parseSample(*unit, stats=stats, diagnostics=diagnostics)
+
+	return results, stats, diagnostics, time.perf_counter() - start
+
+def parseSampleUnits(units, jobs=1, stats=None, diagnostics=None):
+	# yields the parsed output of each unit in the order the units were given; the timings, counters,
+	# and diagnostics of every unit are added to stats and diagnostics, if given
+	if jobs > 1:
+		from concurrent.futures import ProcessPoolExecutor
+
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			for unit,(results, unit_stats, unit_diagnostics, seconds) in zip(units, executor.map(parseSampleUnit, units)):
+				if stats is not None:
+					stats.addUnit(unit[1], unit[2], "parsed", seconds, unit_stats)
+				if diagnostics is not None:
+					diagnostics.merge(unit_diagnostics)
+				yield results
+	else:
+		for unit in units:
+			results, unit_stats, unit_diagnostics, seconds = parseSampleUnit(unit)
+			if stats is not None:
+				stats.addUnit(unit[1], unit[2], "parsed", seconds, unit_stats)
+			if diagnostics is not None:
+				diagnostics.merge(unit_diagnostics)
+			yield results
+
+def cachedUnitResults(units, jobs, caches, stats=None, diagnostics=None):
+	# like parseSampleUnits, but units whose results are cached for every configuration (caches holds
+	# one ResultCache per configuration) are loaded instead of parsed
+	reuse = []
+	for ifn,condition,sample,measurements,settings,cache_dir,reorientation in units:
+		cached = [ cache.has(ifn, condition, sample, dem) for cache,(dem, config) in zip(caches, settings) ] # every cache must see the unit
+		reuse.append( all(cached) )
+
+	parsed = parseSampleUnits([ unit for unit,reusable in zip(units, reuse) if not reusable ], jobs, stats=stats, diagnostics=diagnostics)
+
+	for unit,reusable in zip(units, reuse):
+		ifn,condition,sample,measurements,settings,cache_dir,reorientation = unit
+		if reusable:
+			start = time.perf_counter()
+			results = [ cache.load(condition, sample, measurements, config.num_trials) for cache,(dem, config) in zip(caches, settings) ]
+			if all(result is not None for result in results):
+				if stats is not None:
+					stats.addUnit(condition, sample, "incremental", time.perf_counter() - start, Stats())
+				yield results
+				continue
+			results = next(parseSampleUnits([ unit ], stats=stats, diagnostics=diagnostics)) # a damaged result file is reparsed here
+		else:
+			results = next(parsed)
+
+		for cache,result in zip(caches, results):
+			cache.store(condition, sample, measurements, result)
+		yield results
+
+def fillFrameBuffers(output, columns, s, samples, condition, num_trials, measurements):
+	# copy the columns of the s-th sample into the buffers of its condition, allocating them for the first sample
+	num_frames = len(columns[measurements[0]][0])
+
+	if s == 0:
+		for measurement in measurements:
+			output[measurement] = FrameBuffer(num_frames, num_trials * len(samples))
+	elif num_frames != output[measurements[0]].num_frames:
+		raise ReformatError(f"{samples[s]} has {num_frames} frames in {condition}, but {samples[0]} has {output[measurements[0]].num_frames}. All samples in a condition must have the same number of frames.")
 
-		for sample in samples:
+	for measurement in measurements:
+		for t,values in enumerate(columns[measurement]):
+			output[measurement].setColumn(s * num_trials + t, values)
+
+def streamCondition(ifns, condition, samples, demdict, measurements, num_trials, outfnpre, outfnsuf, downgrade=False, last_not_first=False, treadmill=True, reorientation=None, layouts_seen=None, stats=None, diagnostics=None):
+	# read every sample file of the condition in lockstep, one frame at a time, and write each
+	# output row as soon as it is complete; memory is proportional to the number of columns;
+	# ifns are the input files of the samples, in order; returns the number of rows and bytes written
+	if layouts_seen is None:
+		layouts_seen = {}
+	if stats is None:
+		stats = Stats()
+	if diagnostics is None:
+		diagnostics = Diagnostics()
+
+	from contextlib import ExitStack
+	from itertools import zip_longest
+
+	with ExitStack() as stack:
+		ifds = [ stack.enter_context(openText(ifn)) for ifn in ifns ]
+
+		# decide the columns and scaling of every sample up front
+		plans = []
+		for ifn,ifd,sample in zip(ifns, ifds, samples):
+			data_types, xyzs = readHeader(ifd)
+			xyzs, multipliers = reorientColumns(xyzs, reorientation)
+			indices, inversions, layout = selectTrialIndices(condition, sample, demdict[sample], measurements, num_trials, data_types, xyzs, downgrade=downgrade, last_not_first=last_not_first, treadmill=treadmill, diagnostics=diagnostics)
+			scales = {}
 			for measurement in measurements:
-				output[measurement].extend( [ [] for x in range(0,num_trials,1) ] )
+				scales[measurement] = measurementScale(measurement, demdict[sample], inversions[measurement])
 
-			ifn = f"{infdir}/{condition}/{sample}_{condition}_normalized.txt"
+			selected = [ j for measurement in measurements for j in indices[measurement] ]
+			maxsplit = max(selected) + 1 if selected else 0
+			plans.append( (maxsplit, indices, scales, multipliers) )
+			noteHeaderLayout(layouts_seen, layout, condition, sample)
+			stats.count("input files", 1)
+			stats.count("bytes read", os.path.getsize(ifn))
 
-			with open(ifn, 'r') as ifd:
-				ifd.readline() # skip first line
-				data_types = ifd.readline().rstrip('\n').upper().replace(' ', '').split('\t')
-				ifd.readline() # skip third line
-				ifd.readline() # skip fourth line
-				xyzs = ifd.readline().rstrip('\n').upper().split('\t')
+		ofds = {}
+		for measurement in measurements:
+			ofds[measurement] = stack.enter_context(openText(f"{outfnpre}{condition}_{measurement}{outfnsuf}", 'w'))
+			writeOutputHeader(ofds[measurement], condition, samples, num_trials)
+
+		num_frames = 0
+		missing = {} # (sample index, measurement index, column index) -> the 0-based rows that are missing
+		for row_num,lines in enumerate(zip_longest(*ifds), 6): # the main data starts at row #6 because of 5 header lines
+			if None in lines:
+				raise ReformatError(f"The samples in {condition} do not all have the same number of frames (first difference at row {row_num}). All samples in a condition must have the same number of frames.")
 
-				indices = {}
-				inversions = {}
+			rows = {}
+			for measurement in measurements:
+				rows[measurement] = []
 
-				for measurement in measurements:
-					indices[measurement], inversions[measurement] = extractIndicesAndInversionDecision(measurement,demdict[sample]["inv_limb"],data_types,xyzs,downgrade=downgrade,treadmill=treadmill)
+			for s,(line, (maxsplit, indices, scales, multipliers)) in enumerate(zip(lines, plans)):
+				fields = line.rstrip('\n').split('\t', maxsplit)
 
-					# test if enough trials
-					if len(indices[measurement]) >= num_trials:
-						if last_not_first:
-							indices[measurement] = indices[measurement][-num_trials:]
+				for m,measurement in enumerate(measurements):
+					denom, invert = scales[measurement]
+					row = rows[measurement]
+
+					for i,j in enumerate(indices[measurement]):
+						if fields[j]:
+							value = float(fields[j])
+							if multipliers is not None:
+								value *= multipliers[j]
+							row.append(str(value / denom * invert))
 						else:
-							indices[measurement] = indices[measurement][:num_trials]
-					else:
-						print(f"WARNING: Insufficient trials for {condition} {sample} {measurement}. {len(indices[measurement])} present, {num_trials} expected. Missing trials added and filled with NAs.", file=sys.stderr)
-
-				# parse the actual data
-				mass = float(demdict[sample]["mass"])
-				massxheight = mass * demdict[sample]["height"]
-
-				row_num = 6 # the main data starts at row #6 because of 5 header lines
-				for line in ifd:
-					fields = line.rstrip('\n').split('\t')
-
-					for measurement in measurements:
-						invert = 1
-						if inversions[measurement]:
-							invert = -1
-
-						denom = 1 # angs
-						if measurement == "vgrf":
-							denom = mass
-						elif measurement == "sagmom" or measurement == "frontmom":
-							denom = massxheight
-
-						for i,j in enumerate(indices[measurement]):
-							k = len(output[measurement]) - num_trials + i
-							if fields[j]:
-								output[measurement][k].append(float(fields[j]) / denom * invert)
-							else:
-								print(f"WARNING: missing data in {condition} {sample} {measurement} column #{i+1} (csv row,column: {row_num},{j+1}). This cell is filled with an \"NA\" in the output.", file=sys.stderr)
-								output[measurement][k].append(None)
-
-						for i in range(len(indices[measurement]), num_trials, 1):
-							k = len(output[measurement]) - num_trials + i
-							output[measurement][k].append(None)
-
-				row_num += 1
-
-		# flip orientation (make it a list of rows instead of a list of columns)
-		for measurement in measurements:
-			output[measurement] = transpose2Dlist(output[measurement])
+							missing.setdefault((s, m, j), []).append(row_num - 6)
+							row.append("NA")
 
-		# write the output files
-		for measurement in measurements:
+					row.extend( ["NA"] * (num_trials - len(indices[measurement])) )
 
-			outfn = f"{outfnpre}{condition}_{measurement}{outfnsuf}"
+			for measurement in measurements:
+				ofds[measurement].write(','.join(rows[measurement]) + '\n')
+			num_frames += 1
 
-			with open(outfn, 'w') as ofd:
+	# record the missing cells and the "NA" cells of every sample, in the same order as when the samples are parsed one by one
+	for s,m,j in sorted(missing):
+		diagnostics.addMissing(condition, samples[s], measurements[m], j, missing[(s, m, j)])
+	for s,(maxsplit, indices, scales, multipliers) in enumerate(plans):
+		na = sum(len(rows) for (ms, m, j),rows in missing.items() if ms == s) + num_frames * sum(num_trials - len(indices[measurement]) for measurement in measurements)
+		diagnostics.addCells(condition, samples[s], na, num_frames * num_trials * len(measurements))
 
-				# header lines
-				# 	condition
-				ofd.write(','.join([condition] * (num_trials * len(samples))) + '\n')
+	stats.count("rows read", num_frames * len(samples))
+	stats.count("cells read", num_frames * sum(len(indices[measurement]) for maxsplit,indices,scales,multipliers in plans for measurement in measurements))
 
-				# 	sample
-				outstrs = []
-				for sample in samples:
-					outstrs.append(','.join([sample] * num_trials))
-				ofd.write(','.join(outstrs) + '\n')
+	rows_written = (3 + num_frames) * len(measurements)
+	bytes_written = sum(os.path.getsize(f"{outfnpre}{condition}_{measurement}{outfnsuf}") for measurement in measurements)
 
-				# 	trial number
-				outstrs = []
-				for i in range(1,len(samples) + 1,1):
-					outstrs.append(','.join(list(map(str, range(1, num_trials + 1, 1)))))
-				ofd.write(','.join(outstrs) + '\n')
+	return rows_written, bytes_written
 
-				# data
-				for row in output[measurement]:
-					ofd.write(','.join(list(map(stringify, row))) + '\n')
-	
-	if write_concatenation:
-		writeConcatenatedOutput(outfnpre, outfnsuf, measurements, conditions, control_cond, dup_control)
-		
-	# exit
-	sys.exit(0)
+def outputHeaderLines(condition, samples, num_trials):
+	# 	condition
+	yield ','.join([condition] * (num_trials * len(samples)))
+
+	# 	sample
+	outstrs = []
+	for sample in samples:
+		outstrs.append(','.join([sample] * num_trials))
+	yield ','.join(outstrs)
+
+	# 	trial number
+	outstrs = []
+	for i in range(1,len(samples) + 1,1):
+		outstrs.append(','.join(list(map(str, range(1, num_trials + 1, 1)))))
+	yield ','.join(outstrs)
+
+def outputLines(condition, samples, num_trials, buf):
+	# the lines (without newlines) of the output file for one condition and measurement
+	yield from outputHeaderLines(condition, samples, num_trials)
+
+	for f in range(0, buf.num_frames, 1):
+		yield ','.join(map(stringify, buf.row(f)))
+
+def writeOutputHeader(ofd, condition, samples, num_trials):
+	for line in outputHeaderLines(condition, samples, num_trials):
+		ofd.write(line + '\n')
+
+def writeConditionOutput(outfnpre, outfnsuf, condition, samples, num_trials, measurements, output, lines=None):
+	# returns the number of rows and bytes written; if lines is given, the lines (without newlines) written for each
+	# measurement are also kept in lines[measurement], so the concatenated output does not format them again
+	rows_written = 0
+	bytes_written = 0
+
+	for measurement in measurements:
+
+		outfn = f"{outfnpre}{condition}_{measurement}{outfnsuf}"
+
+		measurement_lines = list(outputLines(condition, samples, num_trials, output[measurement]))
+		with openText(outfn, 'w') as ofd:
+			for line in measurement_lines:
+				ofd.write(line + '\n')
+		rows_written += len(measurement_lines)
+		bytes_written += os.path.getsize(outfn)
+
+		if lines is not None:
+			lines[measurement] = measurement_lines
+
+	return rows_written, bytes_written
+
+def countNonControlConditions(conditions, control_cond, dup_control):
+	non_control_conditions = 0
+	if dup_control: # only used to decide how many times the control condition is repeated
+		for condition in conditions:
+			if condition != control_cond:
+				non_control_conditions += 1
+
+	return non_control_conditions
 
+def writeConcatenatedLines(outfnpre, outfnsuf, measurements, conditions, condition_lines, control_cond, dup_control):
+	# same output as writeConcatenatedOutput, but built from the lines kept by writeConditionOutput
+	# (condition_lines[condition][measurement]) instead of re-reading the per-condition output files
 
+	non_control_conditions = countNonControlConditions(conditions, control_cond, dup_control)
+	rows_written = 0
+	bytes_written = 0
+
+	for measurement in measurements:
+		all_lines = [ condition_lines[condition][measurement] for condition in conditions ]
+
+		# write the concatenated output file (all non-control conditions then the control
+		# conditions repeated as many times are there are non-control conditions)
+		outfn = f"{outfnpre}all_{measurement}{outfnsuf}"
+		with openText(outfn, 'w') as ofd:
+			for lines in zip(*all_lines): # stops as soon as any condition runs out of lines
+				if non_control_conditions > 1:
+					lines = lines + (lines[-1],) * (non_control_conditions - 1)
+				ofd.write(','.join(lines) + '\n')
+				rows_written += 1
+		bytes_written += os.path.getsize(outfn)
+
+	return rows_written, bytes_written
+
+def writeConcatenatedOutput(outfnpre, outfnsuf, measurements, conditions, control_cond, dup_control):
+	# returns the number of rows and bytes written
+
+	non_control_conditions = countNonControlConditions(conditions, control_cond, dup_control)
+	rows_written = 0
+	bytes_written = 0
+
+	for measurement in measurements:
+		all_input_filenames = [ f"{outfnpre}{condition}_{measurement}{outfnsuf}" for condition in conditions ]
+		all_input_filehandles = [ openText(input_fn) for input_fn in all_input_filenames ]
+		lines = [ ifh.readline() for ifh in all_input_filehandles ]
+		if non_control_conditions > 1:
+			lines.extend( [lines[-1]] * (non_control_conditions - 1) )
+
+		# write the concatenated output file (all non-control conditions then the control
+		# conditions repeated as many times are there are non-control conditions)
+		outfn = f"{outfnpre}all_{measurement}{outfnsuf}"
+		with openText(outfn, 'w') as ofd:
+			while all(lines): # since non-empty strings are truthy, this will continue as long as all files provide lines
+				ofd.write(','.join(lines).replace('\n', '') + '\n')
+				rows_written += 1
+				lines = [ ifh.readline() for ifh in all_input_filehandles ]
+				if non_control_conditions > 1:
+					lines.extend( [lines[-1]] * (non_control_conditions - 1) )
+		bytes_written += os.path.getsize(outfn)
+
+		# close the open input files
+		for ifh in all_input_filehandles:
+			ifh.close()
+
+	return rows_written, bytes_written
+
+def stringify(x):
+	if x == x: # NaN (missing data) is the only value not equal to itself
+		return str(x)
+	else:
+		return "NA"
+
+def failOnMissing(diagnostics, condition, sample, max_missing):
+	# stop the run if too much of the output of a sample is missing
+	if diagnostics.missingFraction(condition, sample) > max_missing:
+		raise ReformatError(f"{diagnostics.missingFraction(condition, sample):.2%} of the output of {condition} {sample} is \"NA\", more than the {max_missing:.2%} allowed (see --max-missing).")
+
+def estimateFrames(ifn, size, max_bytes=1 << 18):
+	# the number of frames (data rows) of an input file, from its first max_bytes (decompressed) and its size; returns
+	# (frames, exact), where exact is True if the whole file was read; for a compressed file, the size is scaled by the
+	# compression ratio of what was read, which may take up to one more compressed block
+	with open(ifn, 'rb') as raw:
+		if ifn.endswith(".gz"):
+			import gzip
+			ifd = gzip.GzipFile(fileobj=raw)
+		elif ifn.endswith(".bz2"):
+			import bz2
+			ifd = bz2.BZ2File(raw)
+		elif ifn.endswith(".xz"):
+			import lzma
+			ifd = lzma.LZMAFile(raw)
+		else:
+			ifd = raw
+
+		header_bytes = sum(len(ifd.readline()) for i in range(0,5,1)) # 5 header lines
+		data_bytes = 0
+		num_lines = 0
+		for line in ifd:
+			data_bytes += len(line)
+			num_lines += 1
+			if header_bytes + data_bytes >= max_bytes:
+				break
+		else: # the whole file was read
+			return num_lines, True
+
+		read_bytes = raw.tell() # how much of the file was read (and decompressed) so far
+		if ifd is not raw:
+			# a decompressor reads ahead (bz2 by whole blocks of up to 900 kB), so read what it has already decompressed to
+			# pair the text with the input it came from
+			for line in ifd:
+				if raw.tell() != read_bytes:
+					break
+				data_bytes += len(line)
+				num_lines += 1
+			else:
+				return num_lines, True
+
+		text_bytes = (header_bytes + data_bytes) * size / read_bytes
+
+	return round((text_bytes - header_bytes) * num_lines / data_bytes), False
+
+def mebibytes(n):
+	return f"{n / 1024 / 1024:.1f} MiB"
+
+def workPlan(cohort, configs, measurements, concatenate=True, dup_control=False, concatenate_only=False, long=False):
+	# yields the lines of a description of the work (see --dry-run); the frames of each condition are estimated
+	# from its first input file, since all samples of a condition must have the same number of frames
+	units = [ (condition, sample) for condition in cohort.conditions for sample in cohort.condition_samples[condition] ]
+	input_bytes = sum(cohort.inputFile(condition, sample)[1] for condition,sample in units)
+	yield f"{len(cohort.conditions)} conditions with {len(units)} (condition, sample) units in total; {mebibytes(input_bytes)} of input files in {cohort.input_dir}"
+
+	frames = {}
+	for condition in cohort.conditions:
+		samples = cohort.condition_samples[condition]
+		ifns = [ cohort.inputFile(condition, sample)[0] for sample in samples ]
+		size = sum(cohort.inputFile(condition, sample)[1] for sample in samples)
+		compressed = sum(1 for ifn in ifns if ifn is not None and ifn.endswith(COMPRESSION_EXTENSIONS))
+		frames[condition], exact = estimateFrames(ifns[0], cohort.inputFile(condition, samples[0])[1]) if samples and not concatenate_only else (0, True)
+		yield f"  {condition}: {len(samples)} samples ({', '.join(samples)}), {'' if exact else 'about '}{frames[condition]} frames, {mebibytes(size)} in {len(samples)} input files ({compressed} compressed)"
+
+	non_control_conditions = countNonControlConditions(cohort.conditions, cohort.control_condition, dup_control)
+
+	for config in configs:
+		outputs = f"{config.outfnpre}${{condition}}_${{measurement}}{config.outfnsuf}"
+		if concatenate_only:
+			yield f"{outputs}: only the {len(measurements)} concatenated output files are written, from the existing per-condition output files"
+			continue
+
+		num_files = len(cohort.conditions) * len(measurements)
+		cells = sum(frames[condition] * len(cohort.condition_samples[condition]) * config.num_trials for condition in cohort.conditions) * len(measurements)
+		estimate = cells * ESTIMATED_CELL_BYTES
+
+		if concatenate and cohort.conditions:
+			width = sum(len(cohort.condition_samples[condition]) * config.num_trials for condition in cohort.conditions)
+			if non_control_conditions > 1:
+				width += (non_control_conditions - 1) * len(cohort.condition_samples[cohort.conditions[-1]]) * config.num_trials
+			num_files += len(measurements)
+			estimate += min(frames.values()) * width * len(measurements) * ESTIMATED_CELL_BYTES
+
+		if long:
+			num_files += 1
+			estimate += cells * (ESTIMATED_CELL_BYTES + 30) # plus the condition, sample, trial, frame, and measurement of every value
+
+		compressed = " before compression" if config.outfnsuf.endswith(COMPRESSION_EXTENSIONS) else ""
+		yield f"{outputs}: {num_files} output files with {config.num_trials} trials per sample, about {mebibytes(estimate)}{compressed}"
+
+def reportDiagnostics(diagnostics, diagnostics_fn=None):
+	for line in diagnostics.summaryLines():
+		print(line, file=sys.stderr)
+
+	if diagnostics_fn is not None:
+		import json
+
+		with open(diagnostics_fn, 'w') as ofd:
+			json.dump(diagnostics.report(), ofd, indent=1)
+
+def reportRun(stats, start, show_stats=False, stats_fn=None, profiler=None, profile_fn=None):
+	# print and/or write the stats of the run and dump its profile, as requested
+	if profiler is not None:
+		profiler.disable()
+		profiler.dump_stats(profile_fn)
+
+	wall = time.perf_counter() - start
+
+	if show_stats:
+		for line in stats.summaryLines(wall):
+			print(line, file=sys.stderr)
+
+	if stats_fn is not None:
+		import json
+
+		with open(stats_fn, 'w') as ofd:
+			json.dump(stats.report(wall), ofd, indent=1)
+
+def run(args, stats):
+	# the work of the command line, once the arguments are handled; returns its exit status
+
+	# the conditions, samples, and input files were discovered (and validated) with the arguments
+	configs = args.configs
+	cohort = args.cohort
+
+	# parse the demographics file (once per limb choice in use)
+	with stats.stage("demographics"):
+		for config in configs:
+			cohort.demographics(config.contralateral)
+
+	measurements = MEASUREMENTS
+
+	# only describe the work, if requested
+	if args.dry_run:
+		for line in workPlan(cohort, configs, measurements, concatenate=args.concatenate, dup_control=args.dup_control, concatenate_only=args.concatenate_only, long=args.long):
+			print(line)
+		return 0
+
+	# only re-read and concatenate existing per-condition output files, if requested
+	if args.concatenate_only:
+		with stats.stage("concatenate"):
+			for config in configs:
+				rows_written, bytes_written = writeConcatenatedOutput(config.outfnpre, config.outfnsuf, measurements, cohort.conditions, args.control_condition, args.dup_control)
+				stats.count("rows written", rows_written)
+				stats.count("bytes written", bytes_written)
+		return 0
+
+	# header layout id -> the first (condition, sample) it was seen in
+	layouts_seen = {}
+
+	# missing data and short trials are collected and summarized at the end
+	diagnostics = Diagnostics()
+
+	# the lines written for every condition are kept (per configuration) for the concatenated output,
+	# and the buffers of every condition for the long-format output
+	condition_lines = [ {} for config in configs ]
+	extractions = [ Extraction(config, measurements, cohort.condition_samples) for config in configs ]
+
+	try:
+		# stream each condition straight from the input files to the output files, if requested
+		if args.stream:
+			for condition in cohort.conditions:
+				with stats.stage("stream"):
+					ifns = [ cohort.inputFilename(condition, sample) for sample in cohort.condition_samples[condition] ]
+					rows_written, bytes_written = streamCondition(ifns, condition, cohort.condition_samples[condition], cohort.demographics(args.contralateral), measurements, args.num_trials, args.output_fn_pfx, args.output_fn_sfx, downgrade=args.downgrade, last_not_first=args.last_not_first, treadmill=args.treadmill, reorientation=cohort.reorientation, layouts_seen=layouts_seen, stats=stats, diagnostics=diagnostics)
+				stats.count("rows written", rows_written)
+				stats.count("bytes written", bytes_written)
+				for sample in cohort.condition_samples[condition]:
+					failOnMissing(diagnostics, condition, sample, args.max_missing)
+
+		# otherwise parse each (condition, sample) unit once for every configuration, possibly across several worker processes
+		else:
+			for condition,condition_outputs in extractConditions(cohort, configs, measurements, jobs=args.jobs, cache_dir=args.cache_dir, incremental=args.incremental, max_missing=args.max_missing, stats=stats, diagnostics=diagnostics, layouts_seen=layouts_seen):
+				# write the output files
+				for config,extraction,lines,output in zip(configs, extractions, condition_lines, condition_outputs):
+					if args.concatenate:
+						lines[condition] = {}
+					with stats.stage("write"):
+						rows_written, bytes_written = writeConditionOutput(config.outfnpre, config.outfnsuf, condition, cohort.condition_samples[condition], config.num_trials, measurements, output, lines=lines.get(condition))
+					stats.count("rows written", rows_written)
+					stats.count("bytes written", bytes_written)
+
+					if args.long:
+						extraction.buffers[condition] = output
+	except ReformatError as e:
+		for line in diagnostics.summaryLines():
+			print(line, file=sys.stderr)
+		print(f"ERROR: {e}", file=sys.stderr)
+		return 1
+
+	reportDiagnostics(diagnostics, args.diagnostics_fn)
+
+	if len(layouts_seen) > 1:
+		print(f"NOTE: {len(layouts_seen)} different header layouts were seen across the input files.", file=sys.stderr)
+
+	if args.cache_dir is not None:
+		with stats.stage("cache eviction"):
+			evictCacheEntries(args.cache_dir, args.cache_size * 1024 * 1024)
+
+	if args.concatenate:
+		with stats.stage("concatenate"):
+			if args.stream: # nothing was kept in memory, so the per-condition output files are read back in
+				rows_written, bytes_written = writeConcatenatedOutput(args.output_fn_pfx, args.output_fn_sfx, measurements, cohort.conditions, args.control_condition, args.dup_control)
+				stats.count("rows written", rows_written)
+				stats.count("bytes written", bytes_written)
+			else:
+				for config,lines in zip(configs, condition_lines):
+					rows_written, bytes_written = writeConcatenatedLines(config.outfnpre, config.outfnsuf, measurements, cohort.conditions, lines, args.control_condition, args.dup_control)
+					stats.count("rows written", rows_written)
+					stats.count("bytes written", bytes_written)
+
+	if args.long:
+		with stats.stage("long"):
+			for config,extraction in zip(configs, extractions):
+				rows_written, bytes_written = extraction.writeLong(f"{config.outfnpre}long{config.outfnsuf}")
+				stats.count("rows written", rows_written)
+				stats.count("bytes written", bytes_written)
+
+	return 0
+
+def main():
+	# the command line: every stage is timed, but the stats are only reported if requested
+	start = time.perf_counter()
+	stats = Stats()
+
+	# handle the arguments to the script
+	with stats.stage("arguments"):
+		args = handleArgs()
+
+	#	profile everything that follows, if requested
+	profiler = None
+	if args.profile_fn is not None:
+		import cProfile
+		profiler = cProfile.Profile()
+		profiler.enable()
+
+	# report the stats and profile of the run, if requested, however it ends
+	try:
+		return run(args, stats)
+	finally:
+		reportRun(stats, start, show_stats=args.show_stats, stats_fn=args.stats_fn, profiler=profiler, profile_fn=args.profile_fn)
+
+# ------------- MAIN ----------------------------- ||
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,178 @@
+__author__ = "Brandon Pickett"
+
+# ----------- IMPORTS ---------------------------- ||
+import re
+import sys
+
+TRANSFORMATION_RE = re.compile(r"^[XYZ]=>-?[XYZ]$")
+
+# ---------- FUNCTIONS --------------------------- ||
+def handleArgs():
+
+	if len(sys.argv) == 1: # if no arguments are provided, display help intead of using all defaults
+		sys.argv.append("-h")
+
+	import argparse
+
+	parser = argparse.ArgumentParser(prog="reorient.py", usage="%(prog)s [-j 1] [-s _reoriented] transformation [transformation | input_file]...", description="Reorient Visual 3D (V3D) normalized files (tab-separated value). This does the same thing as reorient.awk, but many files can be done at once and in parallel. Each input file ${dir}/${name}${ext} is written to ${dir}/${name}_reoriented${ext}. Input files compressed with gzip, bzip2, or xz (${ext} ending with .gz, .bz2, or .xz) are decompressed while they are read, and their output is compressed the same way, e.g., a_normalized.txt.gz is written to a_normalized_reoriented.txt.gz. If '-' is given as an input file, stdin is read and the output goes to stdout.", add_help=False)
+
+	input_group = parser.add_argument_group("Transformations and Input Files")
+	input_group.add_argument("items", metavar="transformation | input_file", type=str, nargs="*", help="Transformations and input files may be given in any order. Transformations must match this regex: /^[XYZ]=>-?[XYZ]$/. For example, 'X=>-Y' relabels the X columns as Y and negates their values. Don't forget to put single quotes around the transformation(s), else bash will think you're trying to perform redirection.")
+
+	options_group = parser.add_argument_group("Options")
+	options_group.add_argument("-j", "--jobs", dest="jobs", metavar="int", type=int, action="store", help="The number of files to reorient at once, each in its own worker process. [default: 1]", default=1, required=False)
+	options_group.add_argument("-s", "--suffix", dest="suffix", metavar="_reoriented", type=str, action="store", help="The text inserted between the name and the extension of each input file to form its output file name. [default: _reoriented]", default="_reoriented", required=False)
+
+	misc_group = parser.add_argument_group("Misc", )
+	misc_group.add_argument("-h", "--help", action="help", help="Show this help message and exit")
+	misc_group.add_argument("-v", "--version", action="version", version="%(prog)s 0.2.1-beta", help="Show version number and exit")
+
+	args = parser.parse_args()
+
+	# separate the transformations from the input files
+	transformations = []
+	ifns = []
+	for item in args.items:
+		if TRANSFORMATION_RE.match(item):
+			transformations.append(item)
+		else:
+			ifns.append(item)
+
+	# validate the arguments, as needed
+	from pathlib import Path
+
+	if len(transformations) == 0:
+		print("ERROR: At least one transformation is required, otherwise the output would simply be a copy of the input.", file=sys.stderr)
+		sys.exit(1)
+
+	if len(ifns) == 0:
+		ifns.append('-')
+
+	if args.jobs < 1:
+		print(f"ERROR: At least one job is required to do any work. {args.jobs} is not a sane choice.", file=sys.stderr)
+		sys.exit(1)
+
+	if len(args.suffix) == 0:
+		print("ERROR: An empty suffix would overwrite each input file while it is being read.", file=sys.stderr)
+		sys.exit(1)
+
+	if args.jobs > 1 and '-' in ifns:
+		print("ERROR: stdin ('-') can only be reoriented with a single job.", file=sys.stderr)
+		sys.exit(1)
+
+	for ifn in ifns:
+		if ifn != '-' and not Path(ifn).is_file():
+			print(f"ERROR: {ifn} either does not exist or is not a regular file.", file=sys.stderr)
+			sys.exit(1)
+
+	return transformations, ifns, args.jobs, args.suffix
+
+def parseTransformations(transformations):
+	# 'X=>-Y' maps the X direction to Y and negates it; the last transformation of a direction wins, as in reorient.awk
+	xyz_tfrm = {}
+	mult_tfrm = {}
+
+	for transformation in transformations:
+		if not TRANSFORMATION_RE.match(transformation):
+			raise ValueError(f"{transformation} is not a transformation. Transformations must match this regex: /^[XYZ]=>-?[XYZ]$/.")
+
+		before = transformation[0]
+		xyz_tfrm[before] = transformation[-1]
+		mult_tfrm[before] = -1 if transformation[3] == '-' else 1
+
+	return xyz_tfrm, mult_tfrm
+
+def reorientHeader(xyzs, xyz_tfrm, mult_tfrm):
+	# returns the relabeled xyz header row and the multiplier (1 or -1) of every column
+	new_xyzs = []
+	multipliers = []
+
+	for xyz in xyzs:
+		if xyz in xyz_tfrm:
+			new_xyzs.append(xyz_tfrm[xyz])
+			multipliers.append(mult_tfrm[xyz])
+		else:
+			new_xyzs.append(xyz)
+			multipliers.append(1)
+
+	return new_xyzs, multipliers
+
+def negateCell(x):
+	# negate the text of a cell without converting it to a number; empty (missing) cells stay empty
+	if not x:
+		return x
+	elif x[0] == '-':
+		return x[1:]
+	elif x[0] == '+':
+		return '-' + x[1:]
+	else:
+		return '-' + x
+
+def reorientLines(lines, xyz_tfrm, mult_tfrm):
+	# yields the reoriented lines of one file; lines 1-4 are passed through, line 5 is the xyz header
+	negated = []
+
+	for row_num,line in enumerate(lines, 1):
+		if row_num > 5: # non-header lines
+			if negated:
+				fields = line.rstrip('\n').split('\t')
+				for i in negated:
+					if i < len(fields):
+						fields[i] = negateCell(fields[i])
+				line = '\t'.join(fields) + '\n'
+			yield line
+		elif row_num != 5: # header lines other than xyz
+			yield line
+		else: # if row_num == 5: # xyz header line
+			xyzs, multipliers = reorientHeader(line.rstrip('\n').split('\t'), xyz_tfrm, mult_tfrm)
+			negated = [ i for i,mult in enumerate(multipliers) if mult == -1 ]
+			yield '\t'.join(xyzs) + '\n'
+
+def reorientedFilename(ifn, suffix="_reoriented"):
+	# ${dir}/${name}${ext} -> ${dir}/${name}${suffix}${ext}, as in reorientV3D2UNC.sh; a compression extension is kept after ${ext}
+	from pathlib import Path
+	from reformat import COMPRESSION_EXTENSIONS
+
+	path = Path(ifn)
+	compression = ''
+	if path.suffix in COMPRESSION_EXTENSIONS:
+		compression = path.suffix
+		path = path.with_suffix('')
+
+	return str(path.with_name(f"{path.stem}{suffix}{path.suffix}{compression}"))
+
+def reorientFile(ifn, ofn, transformations):
+	from reformat import openText
+
+	xyz_tfrm, mult_tfrm = parseTransformations(transformations)
+
+	if ifn == '-':
+		sys.stdout.writelines(reorientLines(sys.stdin, xyz_tfrm, mult_tfrm))
+	else:
+		with openText(ifn) as ifd, openText(ofn, 'w') as ofd:
+			ofd.writelines(reorientLines(ifd, xyz_tfrm, mult_tfrm))
+
+	return ofn
+
+def reorientFiles(ifns, transformations, jobs=1, suffix="_reoriented"):
+	ofns = [ reorientedFilename(ifn, suffix) if ifn != '-' else '-' for ifn in ifns ]
+
+	if jobs > 1:
+		from concurrent.futures import ProcessPoolExecutor
+
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			return list(executor.map(reorientFile, ifns, ofns, [transformations] * len(ifns)))
+	else:
+		return [ reorientFile(ifn, ofn, transformations) for ifn,ofn in zip(ifns, ofns) ]
+
+# ------------- MAIN ----------------------------- ||
+if __name__ == "__main__":
+
+	# handle the arguments to the script
+	transformations, ifns, jobs, suffix = handleArgs()
+
+	# reorient every file
+	reorientFiles(ifns, transformations, jobs=jobs, suffix=suffix)
+
+	# exit
+	sys.exit(0)
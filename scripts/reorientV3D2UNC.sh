@@ -19,15 +19,28 @@ SCRIPTS_DIR=$(${READLINK} -f `${DIRNAME} "${BASH_SOURCE[0]}"`)
 # run the command
 for fn in "$@"
 do
+	# compressed files are decompressed on the fly and their output is compressed the same way
+	zsfx=""
+	ZCAT="cat"
+	ZIP="cat"
+	case "${fn}" in
+		*.gz) zsfx=".gz"; ZCAT="gzip -dc"; ZIP="gzip -c" ;;
+		*.bz2) zsfx=".bz2"; ZCAT="bzip2 -dc"; ZIP="bzip2 -c" ;;
+		*.xz) zsfx=".xz"; ZCAT="xz -dc"; ZIP="xz -c" ;;
+	esac
+
 	dn=`${DIRNAME} "${fn}"`
-	sfx=".${fn##*.}"
-	bn=`${BASENAME} "${fn}" "${sfx}"`
+	ufn="${fn%${zsfx}}"
+	sfx=".${ufn##*.}"
+	bn=`${BASENAME} "${ufn}" "${sfx}"`
 
-	time "${AWK}" -f "${SCRIPTS_DIR}/reorient.awk" -- \
+	time ${ZCAT} "${fn}" \
+		| "${AWK}" -f "${SCRIPTS_DIR}/reorient.awk" -- \
 		'X=>-Y' \
 		'Y=>X' \
-		"${fn}" \
-		> "${dn}/${bn}_reoriented${sfx}"
+		- \
+		| ${ZIP} \
+		> "${dn}/${bn}_reoriented${sfx}${zsfx}"
 done
 
 exit $?